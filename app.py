@@ -1,24 +1,38 @@
+import json
 import os
 import random
+from urllib.parse import urlencode
 
-import cufflinks as cf
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import (
+    ALL, MATCH, ClientsideFunction, Input, Output, State)
 import dash_html_components as html
+import dash_table
 from flask import Flask
+from flask_compress import Compress
 import pandas as pd
-from plotly.graph_objs.bar import Marker
-import plotly.graph_objects as go
 import plotly.express as px
 
-from scripts.declining_schedule import generate_pd_per_maslul_declining
-from scripts.straight_schedule import generate_pd_per_maslul_straight
-from scripts.bullet_schedule import generate_pd_per_maslul_bullet
+from scripts import jobs
+from scripts.api import api
+from scripts.figures import (
+    band_figure, changes_x_range, heatmap_figure, payments_figure,
+    schedule_figure, sums_figure, zoom_range)
+from scripts.metrics import instrument
+from scripts.mix_aggregator import (
+    aggregate_mix, key_params, mix_keys, summarize)
+from scripts.monte_carlo import simulate_mix
+from scripts.optimizer import max_offers
+from scripts.schedule_cache import schedule_cache
+from scripts.schedule_table import table_columns, table_page
+from scripts.sensitivity import sensitivity
 
 
 server = Flask(__name__)
+server.register_blueprint(api)
+Compress(server)
 
 app = dash.Dash(
     __name__,
@@ -28,6 +42,7 @@ app = dash.Dash(
 
 app.config.suppress_callback_exceptions = True
 app.title = 'Mortgage Dashboard'
+instrument(app)
 
 PLOTLY_LOGO = "./static/undraw_at_home_octe.svg"
 
@@ -101,13 +116,13 @@ mortgage_df = pd.DataFrame()
 
 
 # Loan Apps
-def gen_maslul(index):
+def gen_maslul(index, title=None, amount=None, interest=None, period=None):
     return html.Div([
         dbc.Row(
             dbc.Input(
-                id=f"inputTitle{index}",
+                id={"type": "inputTitle", "index": index},
                 placeholder="שם המסלול",
-                type="text", maxLength="15",
+                type="text", value=title, maxLength="15",
                 style={
                     'margin': 'auto', 'width': '88%', 'textAlign': 'center'})),
         html.Br(),
@@ -118,9 +133,10 @@ def gen_maslul(index):
                         dbc.InputGroupAddon(
                             "₪", addon_type="prepend"),
                         dbc.Input(
-                            id=f"amount{index}",
+                            id={"type": "amount", "index": index},
                             placeholder="סכום",
                             type="number",
+                            value=amount,
                             max=10000000,
                             min=1000,
                             style={'textAlign': 'center'})
@@ -130,11 +146,12 @@ def gen_maslul(index):
                         dbc.InputGroupAddon(
                             "%", addon_type="prepend"),
                         dbc.Input(
-                            id=f"interest{index}",
+                            id={"type": "interest", "index": index},
                             placeholder="ריבית",
                             type="number",
+                            value=interest,
                             max=10,
-                            min=0,
+                            min=-3,
                             step=0.01,
                             style={'textAlign': 'center'})
                     ], size="sm", className="sm")),
@@ -143,9 +160,10 @@ def gen_maslul(index):
                         dbc.InputGroupAddon(
                             "חודשים", addon_type="prepend"),
                         dbc.Input(
-                            id=f"period{index}",
+                            id={"type": "period", "index": index},
                             placeholder="תקופה",
                             type="number",
+                            value=period,
                             max=420,
                             min=1,
                             style={'textAlign': 'center'})
@@ -161,7 +179,7 @@ def gen_maslul(index):
                         dbc.InputGroupAddon(
                             "%", addon_type="prepend"),
                         dbc.Input(
-                            id=f"madad{index}", placeholder="מדד שנתי",
+                            id={"type": "madad", "index": index}, placeholder="מדד שנתי",
                             type="number", value=1.48953, max=10, min=-2,
                             step=0.00001, style={'textAlign': 'center'}),
                         dbc.InputGroupAddon(
@@ -175,7 +193,7 @@ def gen_maslul(index):
                         'textAlign': 'left'},
                 )),
                 dbc.Col(dbc.Checklist(
-                    id=f"switch{index}",
+                    id={"type": "switch", "index": index},
                     options=[{"label": "מסלול צמוד", "value": 1}],
                     value=[1], switch=True,
                     style={
@@ -193,9 +211,11 @@ def gen_maslul(index):
                         {"label": "בוליט", "value": 'bullet'},
                         {"label": "קרן שווה", "value": 'declining'},
                         {"label": "שפיצר", "value": 'straight'},
+                        {"label": "משתנה כל 5 שנים", "value": 'variable'},
+                        {"label": "פריים + מרווח", "value": 'prime'},
                     ],
                     value='straight',
-                    id=f"schedule{index}",
+                    id={"type": "schedule", "index": index},
                     inline=True,
                     style={
                         'margin': 'auto',
@@ -215,128 +235,27 @@ def gen_maslul(index):
 
         dbc.Row(
             html.P(
-                id=f'pmt{index}',
+                id={"type": "pmt", "index": index},
                 style={
                     'margin': 'auto',
                     'width': '88%',
                     'textAlign': "center"})),
         dbc.Row(
             html.P(
-                id=f'total_pmt{index}',
+                id={"type": "total_pmt", "index": index},
                 style={
                     'margin': 'auto',
                     'width': '88%',
                     'textAlign': "center"})),
         dbc.Row(
             dcc.Graph(
-                id=f'output{index}',
+                id={"type": "output", "index": index},
                 style={
                     'margin': 'auto',
                     'width': '100%'}))
     ])
 
 
-maslulOne = html.Div([
-    dbc.Row(
-        dbc.Input(
-            id="inputTitle1", placeholder="שם המסלול",
-            type="text", value="קבוע צמוד", maxLength="15",
-            style={'margin': 'auto', 'width': '88%', 'textAlign': 'center'})),
-    html.Br(),
-
-    dbc.Row(
-        [
-            dbc.Col(dbc.InputGroup(
-                [
-                    dbc.InputGroupAddon(
-                        "₪", addon_type="prepend"),
-                    dbc.Input(
-                        id="amount1", placeholder="סכום", type="number",
-                        value=100000, max=10000000, min=1000,
-                        style={'textAlign': 'center'})
-                ], size="sm", className="sm")),
-            dbc.Col(dbc.InputGroup(
-                [
-                    dbc.InputGroupAddon(
-                        "%", addon_type="prepend"),
-                    dbc.Input(
-                        id="interest1", placeholder="ריבית", type="number",
-                        value=3, max=10, min=0, step=0.01,
-                        style={'textAlign': 'center'})
-                ], size="sm", className="sm")),
-            dbc.Col(dbc.InputGroup(
-                [
-                    dbc.InputGroupAddon(
-                        "חודשים", addon_type="prepend"),
-                    dbc.Input(
-                        id="period1", placeholder="תקופה", type="number",
-                        value=240, max=420, min=1,
-                        style={'textAlign': 'center'})
-                ], size="sm", className="sm")),
-        ], style={'margin': 'auto', 'width': '100%'}),
-    html.Br(),
-    html.Hr(),
-
-    dbc.Row(
-        [
-            dbc.Col(dbc.InputGroup(
-                [
-                    dbc.InputGroupAddon(
-                        "%", addon_type="prepend"),
-                    dbc.Input(
-                        id="madad1", placeholder="מדד שנתי",
-                        type="number", value=1.48953,
-                        max=10, min=-2, step=0.00001,
-                        style={'textAlign': 'center'}),
-                    dbc.InputGroupAddon(
-                        "מדד שנתי משוער", addon_type="append"),
-                ],
-                size="sm",
-                className="sm",
-                style={'margin': 'auto', 'width': '122%', 'textAlign': 'left'},
-            )),
-            dbc.Col(dbc.Checklist(
-                id="switch1", options=[{"label": "מסלול צמוד", "value": 1}],
-                value=[1], switch=True,
-                style={'margin': 'auto', 'width': '100%', 'textAlign': 'right'}
-            )),
-        ], style={'margin': 'auto', 'width': '100%'}),
-    html.Br(),
-
-    dbc.Row(
-        [
-            dbc.Col(dbc.RadioItems(
-                    options=[
-                        {"label": "בוליט", "value": 'bullet'},
-                        {"label": "קרן שווה", "value": 'declining'},
-                        {"label": "שפיצר", "value": 'straight'},
-                    ],
-                    value='straight',
-                    id="schedule1",
-                    inline=True,
-                    style={'margin': 'auto', 'width': '140%',
-                           'textAlign': 'left'},
-                    )
-                    ),
-            dbc.Col(html.P('שיטת החזר (לוח)', style={
-                    'margin': 'auto', 'width': '100%', 'textAlign': 'right'})),
-        ], style={'margin': 'auto', 'width': '100%'}),
-    html.Hr(),
-
-    dbc.Row(html.P(id='pmt1', style={
-            'margin': 'auto', 'width': '88%', 'textAlign': "center"})),
-    dbc.Row(html.P(id='total_pmt1', style={
-            'margin': 'auto', 'width': '88%', 'textAlign': "center"})),
-    dbc.Row(dcc.Graph(id='output1', style={'margin': 'auto', 'width': '100%'}))
-])
-
-maslulTwo = gen_maslul(2)
-maslulThree = gen_maslul(3)
-maslulFour = gen_maslul(4)
-maslulFive = gen_maslul(5)
-maslulSix = gen_maslul(6)
-
-
 ###############################################################################
 """Body Components"""
 
@@ -357,34 +276,42 @@ def gen_card_for_loan(index, maslul):
                 "object-fit": "cover"}),
             dbc.CardBody(
                 [
-                    dbc.Button(f"הזן מסלול {index}", id=f"openmaslul{index}",
-                               outline=True, color="link", size="sm"),
+                    dbc.Button(
+                        f"הזן מסלול {index}",
+                        id={"type": "openmaslul", "index": index},
+                        outline=True, color="link", size="sm"),
                     html.Hr(),
                     html.H6(
-                        id=f'cardTitle{index}',
+                        id={"type": "cardTitle", "index": index},
                         className="card-title text-primary",
                         style={'textAlign': "right"}),
                     html.H6(
-                        id=f'cardSum{index}',
+                        id={"type": "cardSum", "index": index},
                         className="card-title text-primary",
                         style={'textAlign': "right"}),
                     html.H6(
-                        id=f'cardPeriod{index}',
+                        id={"type": "cardPeriod", "index": index},
                         className="card-title text-primary",
                         style={'textAlign': "right"}),
                     html.H6(
-                        id=f'cardInterest{index}',
+                        id={"type": "cardInterest", "index": index},
                         className="card-title text-primary",
                         style={'textAlign': "right"}),
                     dbc.Modal(
                         [
                             dbc.ModalHeader(),
                             dbc.ModalBody(maslul),
-                            dbc.ModalFooter(dbc.Button(
-                                "סגור", id=f"closemaslul{index}",
-                                outline=True, color="info", size="sm"))
+                            dbc.ModalFooter([
+                                dbc.Button(
+                                    "הסר מסלול",
+                                    id={"type": "removemaslul", "index": index},
+                                    outline=True, color="danger", size="sm"),
+                                dbc.Button(
+                                    "סגור",
+                                    id={"type": "closemaslul", "index": index},
+                                    outline=True, color="info", size="sm")])
                         ],
-                        id=f"modalmaslul{index}",
+                        id={"type": "modalmaslul", "index": index},
                     ),
                 ]
             ),
@@ -393,12 +320,20 @@ def gen_card_for_loan(index, maslul):
     )
 
 
-cardmaslulOne = gen_card_for_loan(1, maslulOne)
-cardmaslulTwo = gen_card_for_loan(2, maslulTwo)
-cardmaslulThree = gen_card_for_loan(3, maslulThree)
-cardmaslulFour = gen_card_for_loan(4, maslulFour)
-cardmaslulFive = gen_card_for_loan(5, maslulFive)
-cardmaslulSix = gen_card_for_loan(6, maslulSix)
+def gen_track(index, **values):
+    # A track is its card and input modal; every id carries the track's
+    # index, so tracks can be added and removed freely.
+    return html.Div(
+        gen_card_for_loan(index, gen_maslul(index, **values)),
+        id={"type": "track", "index": index},
+        style={
+            "size": 1, "height": "75%",
+            'float': 'right', "margin": '2em auto'})
+
+
+initial_tracks = [
+    gen_track(1, title="קבוע צמוד", amount=100000, interest=3, period=240)
+] + [gen_track(index) for index in range(2, 7)]
 
 head_card = [
     dbc.CardBody(
@@ -449,28 +384,11 @@ rows = html.Div(
             [
                 dbc.Col(
                     [
-                        dbc.Row(
-                            [
-                                html.Div(cardmaslulSix, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                                html.Div(cardmaslulFive, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                                html.Div(cardmaslulFour, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                                html.Div(cardmaslulThree, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                                html.Div(cardmaslulTwo, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                                html.Div(cardmaslulOne, style={
-                                    "size": 1, "height": "75%",
-                                    'float': 'right', "margin": '2em auto'}),
-                            ]
-                        )
+                        dbc.Row(initial_tracks, id="tracks"),
+                        dbc.Row(dbc.Button(
+                            "הוסף מסלול", id="add_track",
+                            outline=True, color="link", size="sm"),
+                            style={'float': 'right'}),
                     ]
                 ),
             ],
@@ -497,21 +415,72 @@ rows = html.Div(
             style={'margin': 'auto', 'width': '80vw'}
         ),
         dbc.Row(html.Br()),
+        dbc.Row(
+            dbc.Col(
+                [
+                    dbc.Button(
+                        "הרץ תרחישי מדד", id="cpi_bands",
+                        outline=True, color="primary", size="sm"),
+                    dcc.Graph(id="df_cpi_bands"),
+                ], width={"size": 12}),
+            style={'margin': 'auto', 'width': '80vw'}
+        ),
+        dbc.Row(html.Br()),
+        dbc.Row(
+            [
+                dbc.Col(dcc.Graph(id="df_sensitivity"), width={"size": 9}),
+                dbc.Col(
+                    [
+                        html.H6("מסלול", style={'text-align': 'right'}),
+                        dcc.Dropdown(id="sensitivity_track", clearable=False),
+                        html.Br(),
+                        dbc.RadioItems(
+                            id="sensitivity_metric",
+                            options=[
+                                {"label": "החזר ראשוני", "value": "first_pmt"},
+                                {"label": "החזר בשיא", "value": "max_pmt"},
+                                {"label": "סך החזרים", "value": "total_pmt"},
+                            ],
+                            value="total_pmt"),
+                    ], width={"size": 3}, style={'text-align': 'right'}),
+            ],
+            style={'margin': 'auto', 'width': '80vw'}
+        ),
+        dbc.Row(html.Br()),
+        dbc.Row(
+            dbc.Col(
+                [
+                    dbc.Button(
+                        "חפש תמהיל זול יותר", id="optimize",
+                        outline=True, color="primary", size="sm"),
+                    dbc.Progress(
+                        id="job_progress", value=0, striped=True,
+                        animated=True, style={'margin': '10px 0'}),
+                    html.Div(id="job_result"),
+                    dcc.Interval(id="job_poll", interval=1000, disabled=True),
+                    dcc.Store(id="job"),
+                ], width={"size": 12}),
+            style={'margin': 'auto', 'width': '80vw'}
+        ),
+        dbc.Row(html.Br()),
         dbc.Row(
             [
 
                 dbc.Col(
-                    [dbc.Row(dbc.Container(dcc.RangeSlider(
-                        id='slider', min=0, max=360, value=[0, 8], marks={
-                            0: {'label': '😄', 'style': {'color': '#77b0b1'}},
-                            24: {'label': '24'},
-                            60: {'label': '😯'},
-                            120: {'label': '120'},
-                            180: {'label': '😰'},
-                            240: {'label': '240'},
-                            300: {'label': '😱'},
-                            360: {'label': '360', 'style': {'color': '#f50'}}
-                        }))), html.Br(), dbc.Table(id='table')
+                    [dash_table.DataTable(
+                        id='table',
+                        page_action='custom', page_current=0, page_size=12,
+                        sort_action='custom', sort_mode='single', sort_by=[],
+                        style_cell={'textAlign': 'center'},
+                        style_as_list_view=True),
+                     dcc.Store(id='mix'),
+                     html.Div([
+                         html.A("הורד לוח סילוקין מלא (CSV)",
+                                id="export_csv", download="schedule.csv"),
+                         " | ",
+                         html.A("Excel", id="export_xlsx",
+                                download="schedule.xlsx"),
+                     ], style={'text-align': 'right'}),
                      ], width={"size": 12, "height": "45%"}),
 
             ],
@@ -533,155 +502,51 @@ app.layout = html.Div(
 ###############################################################################
 """Apps Functions"""
 
-# Loan callbacks
-months_heb = "חודש"
-pmt_heb = "החזר חודשי"
-ppmt_heb = "תשלום קרן"
-ipmt_heb = "תשלום ריבית"
-
-
-def generate_pd_per_maslul(schedule, cpi, madad, amount, i, period):
-    if schedule == 'straight':
-        return generate_pd_per_maslul_straight(cpi, madad, amount, i, period)
-    elif schedule == 'declining':
-        return generate_pd_per_maslul_declining(cpi, madad, amount, i, period)
-    return generate_pd_per_maslul_bullet(cpi, madad, amount, i, period)
+# Points per line of the schedule charts, before zooming in.
+chart_points = 150
 
 
 # Building data for all (loans) in one. Brutallity callback.
+# Every field of every track comes in as one list, in the tracks' order.
 @app.callback([
-    Output("df_total_output", "figure"), Output("df_sums", "figure"),
-    Output("df_payments", "figure"), Output("df_sums_explain", "children"),
-    Output("table", "children")
+    Output("df_sums", "figure"), Output("df_sums_explain", "children"),
+    Output("mix", "data")
 ],
     [
-        Input('schedule1', 'value'), Input('switch1', 'value'),
-        Input('madad1', 'value'), Input('amount1', 'value'),
-        Input('interest1', 'value'), Input('period1', 'value'),
-        Input('schedule2', 'value'), Input('switch2', 'value'),
-        Input('madad2', 'value'), Input('amount2', 'value'),
-        Input('interest2', 'value'), Input('period2', 'value'),
-        Input('schedule3', 'value'), Input('switch3', 'value'),
-        Input('madad3', 'value'), Input('amount3', 'value'),
-        Input('interest3', 'value'), Input('period3', 'value'),
-        Input('schedule4', 'value'), Input('switch4', 'value'),
-        Input('madad4', 'value'), Input('amount4', 'value'),
-        Input('interest4', 'value'), Input('period4', 'value'),
-        Input('schedule5', 'value'), Input('switch5', 'value'),
-        Input('madad5', 'value'), Input('amount5', 'value'),
-        Input('interest5', 'value'), Input('period5', 'value'),
-        Input('schedule6', 'value'), Input('switch6', 'value'),
-        Input('madad6', 'value'), Input('amount6', 'value'),
-        Input('interest6', 'value'), Input('period6', 'value'),
-        Input('slider', 'value')
+        Input({"type": "schedule", "index": ALL}, 'value'),
+        Input({"type": "switch", "index": ALL}, 'value'),
+        Input({"type": "madad", "index": ALL}, 'value'),
+        Input({"type": "amount", "index": ALL}, 'value'),
+        Input({"type": "interest", "index": ALL}, 'value'),
+        Input({"type": "period", "index": ALL}, 'value'),
 ])
-def display_value(
-    schedule1, cpi1, inf1, amount1, i1, per1,
-    schedule2, cpi2, inf2, amount2, i2, per2,
-    schedule3, cpi3, inf3, amount3, i3, per3,
-    schedule4, cpi4, inf4, amount4, i4, per4,
-    schedule5, cpi5, inf5, amount5, i5, per5,
-    schedule6, cpi6, inf6, amount6, i6, per6, slider_value
-):
-    frames = []
-    amount = 0
-    total_ipmt_nominal = 0
-
-    try:
-        maslul1_df, total_ipmt_nominal1 = generate_pd_per_maslul(
-            schedule1, cpi1, inf1, amount1, i1, per1)
-        frames.append(maslul1_df)
-        total_ipmt_nominal += total_ipmt_nominal1
-        amount += amount1
-    except Exception:
-        pass
-
-    try:
-        maslul2_df, total_ipmt_nominal2 = generate_pd_per_maslul(
-            schedule2, cpi2, inf2, amount2, i2, per2)
-        frames.append(maslul2_df)
-        total_ipmt_nominal += total_ipmt_nominal2
-        amount += amount2
-    except Exception:
-        pass
-
-    try:
-        maslul3_df, total_ipmt_nominal3 = generate_pd_per_maslul(
-            schedule3, cpi3, inf3, amount3, i3, per3)
-        frames.append(maslul3_df)
-        total_ipmt_nominal += total_ipmt_nominal3
-        amount += amount3
-    except Exception:
-        pass
-
-    try:
-        maslul4_df, total_ipmt_nominal4 = generate_pd_per_maslul(
-            schedule4, cpi4, inf4, amount4, i4, per4)
-        frames.append(maslul4_df)
-        total_ipmt_nominal += total_ipmt_nominal4
-        amount += amount4
-    except Exception:
-        pass
-
-    try:
-        maslul5_df, total_ipmt_nominal5 = generate_pd_per_maslul(
-            schedule5, cpi5, inf5, amount5, i5, per5)
-        frames.append(maslul5_df)
-        total_ipmt_nominal += total_ipmt_nominal5
-        amount += amount5
-    except Exception:
-        pass
-
-    try:
-        maslul6_df, total_ipmt_nominal6 = generate_pd_per_maslul(
-            schedule6, cpi6, inf6, amount6, i6, per6)
-        frames.append(maslul6_df)
-        total_ipmt_nominal += total_ipmt_nominal6
-        amount += amount6
-    except Exception:
-        pass
-
-    df_total = pd.DataFrame()
-    for frame in sorted(frames, key=len, reverse=True):
-        df_total = df_total.add(frame, fill_value=0)
-
-    try:
-        df_total = df_total.drop(columns=months_heb)
-    except KeyError:
+def display_value(schedules, cpis, madads, amounts, interests, periods):
+    tracks = list(zip(schedules, cpis, madads, amounts, interests, periods))
+    mix = aggregate_mix(tracks)
+    if mix is None:
         raise dash.exceptions.PreventUpdate
-
-    df_total.insert(0, months_heb, range(1, len(df_total) + 1))
-    total_ppmt = df_total[ppmt_heb].sum()
-    total_ipmt = df_total[ipmt_heb].sum()
-    total_pmt = df_total[pmt_heb].sum()
-    total_cpi = total_pmt - amount - total_ipmt_nominal
-    if total_cpi <= 2:
-        total_cpi = 0
-    max_pmt = pd.Series(df_total[pmt_heb]).max()
-
-    # דוח יתרות
-    df_reversed = df_total[df_total.columns[::-1]]
-    table = dbc.Table.from_dataframe(
-        round(df_reversed[slider_value[0]:slider_value[1]], 2),
-        striped=True, bordered=True, responsive='sm',
-        hover=True, style={'textAlign': 'center'})
+    arrays, total_ipmt_nominal, amount = mix
+    totals = summarize(arrays, total_ipmt_nominal, amount)
+    total_cpi = totals["total_cpi"]
 
     # Summary table
     row1 = html.Tr([html.Td(f'{round(amount, 1):,}'), html.Td(
         "סך הלוואה")], style={"height": "20%"})
     row2 = html.Tr(
         [html.Td(
-            f'{round(df_total[pmt_heb][0], 1):,}'), html.Td("החזר ראשוני")])
+            f'{round(totals["first_pmt"], 1):,}'), html.Td("החזר ראשוני")])
     row3 = html.Tr(
-        [html.Td(f'{round(total_pmt / amount, 2):,}'), html.Td("החזר לשקל")])
-    row4 = html.Tr([html.Td(f'{round(total_pmt, 1):,}'),
+        [html.Td(f'{round(totals["pmt_per_shekel"], 2):,}'),
+         html.Td("החזר לשקל")])
+    row4 = html.Tr([html.Td(f'{round(totals["total_pmt"], 1):,}'),
                     html.Td("סך החזרים עד סוף תקופה")])
     row5 = html.Tr(
         [html.Td(
             f'{round(total_ipmt_nominal, 1):,}'), html.Td("סך החזרי ריבית")])
     row6 = html.Tr(
         [html.Td(f'{round(total_cpi, 1):,}'), html.Td("סך החזרי הצמדה")])
-    row7 = html.Tr([html.Td(f'{round(max_pmt, 1):,}'), html.Td("החזר בשיא")])
+    row7 = html.Tr(
+        [html.Td(f'{round(totals["max_pmt"], 1):,}'), html.Td("החזר בשיא")])
 
     table_body = [html.Tbody([row1, row2, row7, row3, row4, row5, row6])]
 
@@ -689,159 +554,322 @@ def display_value(
         table_body, striped=True, bordered=True,
         responsive='sm', hover=True, style={'textAlign': 'right'})
 
-    '''גרף נתוני כל המשכנתא'''
-    df_total.index += 1
-    try:
-        fig = df_total.loc[:, df_total.columns != "חודש"] \
-            .round(decimals=0).iplot(asFigure=True)
-    except KeyError:
-        raise dash.exceptions.PreventUpdate
-
-    fig.update_layout(
-        title_text='תצוגה גרפית של לוח סילוקין',
-        title_x=0.5,
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        legend_bgcolor='rgba(0,0,0,0)'
-    )
-
     '''גרף סך החזרים'''
     labels = ["קרן", "ריבית", "הצמדה"]
     values = [amount, round(total_ipmt_nominal), round(total_cpi)]
-    fig_sums = go.Figure(data=[go.Pie(labels=labels, values=values, hole=.2)])
-    fig_sums.update_layout(
-        title_text='התפלגות סך ההחזרים עד סוף תקופת המשכנתא',
-        title_x=0.5,
-    )
-    fig_sums.update_traces(
-        hoverinfo='label',
-        textposition='inside',
-        textinfo='percent+value'
-    )
-
-    '''גרך תשלומים חודשיים לפי ריבית - הצמדה'''
-    fig_payments = go.Figure(data=[
-        go.Bar(
-            name='תשלום ריבית',
-            x=df_total["חודש"],
-            y=df_total['תשלום ריבית'].round(
-                decimals=2), marker=Marker(color='rgb(90, 202, 138)')),
-        go.Bar(
-            name='תשלום קרן', x=df_total["חודש"],
-            y=df_total['תשלום קרן'].round(
-                decimals=2), marker=Marker(color='rgb(250, 131, 210)'))
-    ])
-    fig_payments.update_layout(
-        barmode='stack',
-        title_text='החזר חודשי בחלוקה לקרן וריבית',
-        title_x=0.5,
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)'
-    )
+    fig_sums = sums_figure(
+        labels, values, title='התפלגות סך ההחזרים עד סוף תקופת המשכנתא')
 
-    return fig, fig_sums, fig_payments, summary, table
+    return fig_sums, summary, mix_keys(tracks)
 
 
-def loan_callback(i):
-    @app.callback(
-        [
-            Output("output{}".format(i), "figure"),
-            Output('pmt{}'.format(i), 'children'),
-            Output('total_pmt{}'.format(i), 'children')],
-        [
-            Input('schedule{}'.format(i), 'value'),
-            Input('switch{}'.format(i), 'value'),
-            Input('madad{}'.format(i), 'value'),
-            Input('amount{}'.format(i), 'value'),
-            Input('interest{}'.format(i), 'value'),
-            Input('period{}'.format(i), 'value')])
-    def display_value(schedule, cpi, madad, amount, i, period):
-        try:
-            maslul_df, total_ipmt_nominal = generate_pd_per_maslul(
-                schedule, cpi, madad, amount, i, period)
-        except TypeError:
-            raise dash.exceptions.PreventUpdate
+# The schedule charts follow the mix store, and redraw in full detail
+# where the user zooms in; otherwise each line is sampled down to
+# chart_points and the payment bars are yearly.
+@app.callback(
+    [Output("df_total_output", "figure"), Output("df_payments", "figure")],
+    [Input('mix', 'data'), Input("df_total_output", "relayoutData"),
+     Input("df_payments", "relayoutData")])
+def display_mix_figures(keys, total_relayout, payments_relayout):
+    if not keys:
+        raise dash.exceptions.PreventUpdate
+    triggered = [
+        trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    relayouts = {
+        "df_total_output.relayoutData": total_relayout,
+        "df_payments.relayoutData": payments_relayout}
+    if triggered and all(
+            prop in relayouts and not changes_x_range(relayouts[prop])
+            for prop in triggered):
+        raise dash.exceptions.PreventUpdate
+    mix = aggregate_mix([key_params(key) for key in keys])
+    if mix is None:
+        raise dash.exceptions.PreventUpdate
+    arrays = mix[0]
+
+    fig = dash.no_update
+    if "df_payments.relayoutData" not in triggered:
+        '''גרף נתוני כל המשכנתא'''
+        fig = schedule_figure(
+            arrays, ("ppmt", "ipmt", "pmt", "cumulative", "balance"),
+            title='תצוגה גרפית של לוח סילוקין', decimals=0,
+            max_points=chart_points, x_range=zoom_range(total_relayout))
+
+    fig_payments = dash.no_update
+    if "df_total_output.relayoutData" not in triggered:
+        '''גרך תשלומים חודשיים לפי ריבית - הצמדה'''
+        fig_payments = payments_figure(
+            arrays, title='החזר חודשי בחלוקה לקרן וריבית',
+            max_points=chart_points, x_range=zoom_range(payments_relayout))
+    return fig, fig_payments
+
+
+# דוח יתרות
+# Only the track keys travel through the 'mix' store. Paging and sorting
+# re-read the aggregate (all cache hits) and send one page of rows.
+@app.callback(
+    [Output("table", "data"), Output("table", "columns"),
+     Output("table", "page_count")],
+    [Input("table", "page_current"), Input("table", "page_size"),
+     Input("table", "sort_by"), Input('mix', 'data')])
+def display_table(page_current, page_size, sort_by, keys):
+    if not keys:
+        raise dash.exceptions.PreventUpdate
+    mix = aggregate_mix([key_params(key) for key in keys])
+    if mix is None:
+        raise dash.exceptions.PreventUpdate
+    arrays = mix[0]
+    records, page_count = table_page(arrays, page_current, page_size, sort_by)
+    return records, table_columns(arrays), page_count
+
+
+# Download links for the full schedule of every track and of the mix,
+# streamed by the API (scripts/export.py) from the same track keys.
+@app.callback(
+    [Output("export_csv", "href"), Output("export_xlsx", "href")],
+    [Input('mix', 'data')])
+def export_links(keys):
+    tracks = [
+        {"schedule": schedule, "linked": bool(cpi), "madad": madad,
+         "amount": amount, "interest": interest, "period": period}
+        for schedule, cpi, madad, amount, interest, period in (
+            key_params(key) for key in keys or [] if key is not None)]
+    if not tracks:
+        raise dash.exceptions.PreventUpdate
+    query = urlencode({"tracks": json.dumps(tracks, separators=(",", ":"))})
+    return f"/api/v1/export.csv?{query}", f"/api/v1/export.xlsx?{query}"
+
+
+# Monte Carlo CPI: the range of monthly payments the mix could see. A
+# thousand paths is too slow for every keystroke, so it runs on a click.
+@app.callback(
+    Output("df_cpi_bands", "figure"), [Input("cpi_bands", "n_clicks")],
+    [State('mix', 'data')])
+def display_cpi_bands(n_clicks, keys):
+    tracks = [key_params(key) for key in keys or [] if key is not None]
+    if not n_clicks or not tracks:
+        raise dash.exceptions.PreventUpdate
+    bands = simulate_mix(tracks, paths=1000, seed=0)
+    return band_figure(
+        bands["months"], bands["pmt"], ["P5", "P50", "P95"],
+        title='טווח ההחזר החודשי בתרחישי מדד (P5-P95)',
+        max_points=chart_points)
+
+
+# Sensitivity: one track's rate and period over a whole grid, for the mix
+# (scripts/sensitivity.py), instead of editing them a value at a time.
+# Tracks are picked by the index on their card; the mix keys are in the
+# cards' order, which the amount inputs' ids give.
+@app.callback(
+    [Output("sensitivity_track", "options"),
+     Output("sensitivity_track", "value")],
+    [Input('mix', 'data')],
+    [State({"type": "amount", "index": ALL}, "id"),
+     State("sensitivity_track", "value")])
+def sensitivity_tracks(keys, ids, index):
+    indices = [
+        track_id["index"] for track_id, key in zip(ids, keys or [])
+        if key is not None]
+    if not indices:
+        raise dash.exceptions.PreventUpdate
+    options = [
+        {"label": f"מסלול {index}", "value": index} for index in indices]
+    return options, index if index in indices else indices[0]
+
+
+@app.callback(
+    Output("df_sensitivity", "figure"),
+    [Input("sensitivity_track", "value"),
+     Input("sensitivity_metric", "value"), Input('mix', 'data')],
+    [State({"type": "amount", "index": ALL}, "id")])
+def display_sensitivity(index, metric, keys, ids):
+    slots = [track_id["index"] for track_id in ids]
+    if index not in slots or not keys or len(keys) != len(ids):
+        raise dash.exceptions.PreventUpdate
+    slot = slots.index(index)
+    if keys[slot] is None:
+        raise dash.exceptions.PreventUpdate
+    tracks = [key_params(key) for key in keys]
+    grid = sensitivity(tracks, slot)
+    labels = {"first_pmt": "החזר ראשוני", "max_pmt": "החזר בשיא",
+              "total_pmt": "סך החזרים"}
+    _, _, _, _, interest, period = tracks[slot]
+    return heatmap_figure(
+        grid["periods"], grid["rates"], grid[metric],
+        title=f'{labels[metric]} לפי ריבית ותקופה של מסלול {index}',
+        x_title="תקופה (חודשים)", y_title="ריבית (%)",
+        marker=(period, interest))
+
+
+# Cheaper mix: the search runs as a background job (scripts/jobs.py) and
+# job_poll reads its progress every second until it is done, so no worker
+# waits on it.
+schedule_heb = {
+    "bullet": "בוליט", "declining": "קרן שווה", "straight": "שפיצר",
+    "variable": "משתנה", "prime": "פריים"}
+
+
+def optimize_params(tracks):
+    # The mix's own tracks are the offers, and a mix may not start with a
+    # higher monthly payment than it does.
+    mix = aggregate_mix(tracks)
+    if mix is None:
+        return None
+    arrays, _, amount = mix
+    offers = dict.fromkeys(
+        (schedule, bool(cpi), madad, interest)
+        for schedule, cpi, madad, _, interest, _ in tracks)
+    return {
+        "total": amount,
+        "offers": [
+            {"schedule": schedule, "linked": linked, "madad": madad,
+             "interest": interest}
+            for schedule, linked, madad, interest in offers],
+        "max_first_pmt": float(arrays["pmt"][0]),
+        "top": 5,
+    }
+
+
+def mixes_table(mixes):
+    if not mixes:
+        return dbc.Alert("לא נמצא תמהיל זול יותר", color="light")
+    header = html.Thead(html.Tr([
+        html.Th("סך החזרים"), html.Th("החזר בשיא"), html.Th("החזר ראשוני"),
+        html.Th("מסלולים")]))
+    rows = [
+        html.Tr([
+            html.Td(f'{round(mix["total_pmt"], 1):,}'),
+            html.Td(f'{round(mix["max_pmt"], 1):,}'),
+            html.Td(f'{round(mix["first_pmt"], 1):,}'),
+            html.Td(", ".join(
+                f'{schedule_heb.get(track["schedule"], track["schedule"])} '
+                f'{track["interest"]}% {round(track["amount"]):,} '
+                f'/ {track["period"]}'
+                for track in mix["tracks"]))])
+        for mix in mixes]
+    return dbc.Table(
+        [header, html.Tbody(rows)], striped=True, bordered=True,
+        responsive='sm', hover=True, style={'textAlign': 'right'})
 
-        df = maslul_df[[pmt_heb, ppmt_heb, ipmt_heb]]
-        df.index += 1
 
-        try:
-            fig = df.iplot(asFigure=True)
-        except KeyError:
+@app.callback(
+    [Output("job", "data"), Output("job_poll", "disabled"),
+     Output("job_progress", "value"), Output("job_progress", "children"),
+     Output("job_result", "children")],
+    [Input("optimize", "n_clicks"), Input("job_poll", "n_intervals")],
+    [State("mix", "data"), State("job", "data")])
+def optimize_job(n_clicks, n_intervals, keys, job_id):
+    triggered = [
+        trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if "optimize.n_clicks" in triggered:
+        tracks = [key_params(key) for key in keys or [] if key is not None]
+        params = optimize_params(tracks) if n_clicks and tracks else None
+        if params is None:
             raise dash.exceptions.PreventUpdate
+        if len(params["offers"]) > max_offers:
+            message = f"החיפוש מוגבל ל-{max_offers} מסלולים שונים"
+            return None, True, 0, "", dbc.Alert(message, color="warning")
+        return jobs.submit("optimize", params), False, 0, "", None
 
-        fig.update_layout(
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            legend_bgcolor='rgba(0,0,0,0)'
-        )
+    if job_id is None:
+        raise dash.exceptions.PreventUpdate
+    status = jobs.status(job_id)
+    if status is None:  # expired, or the page was reloaded
+        return None, True, 0, "", None
+    if status["state"] in ("queued", "running"):
+        progress = round(100 * status["progress"])
         return (
-            fig,
-            f"תשלום חודשי ראשוני:  {round(maslul_df[pmt_heb][0], 2):,}",
-            f" החזר בסוף תקופה: {round(maslul_df[pmt_heb].sum(), 1):,}")
-
-
-# Render loan description
-def card_callback(i):
-    @app.callback(Output(f"cardTitle{i}", "children"),
-                  [Input(f'inputTitle{i}', 'value')])
-    def render_title(t):
-        if t:
-            return t
-
-    @app.callback(Output(f"cardSum{i}", "children"),
-                  [Input(f'amount{i}', 'value')])
-    def render_amount(a):
-        if a:
-            return a
+            dash.no_update, False, progress, f"{progress}%",
+            dash.no_update)
+    if status["state"] == "failed":
+        return None, True, 0, "", dbc.Alert(status["error"], color="danger")
+    return None, True, 100, "100%", mixes_table(jobs.result(job_id))
+
+
+# Tracks: adding one appends a card with the next free index, removing
+# one drops its card; the other tracks keep their inputs.
+@app.callback(
+    Output("tracks", "children"),
+    [Input("add_track", "n_clicks"),
+     Input({"type": "removemaslul", "index": ALL}, "n_clicks")],
+    [State("tracks", "children")])
+def edit_tracks(add_clicks, remove_clicks, tracks):
+    triggered = dash.callback_context.triggered
+    if not triggered or not triggered[0]["value"]:
+        raise dash.exceptions.PreventUpdate
+    prop_id = triggered[0]["prop_id"].rsplit(".", 1)[0]
+    if prop_id == "add_track":
+        index = max(
+            (track["props"]["id"]["index"] for track in tracks), default=0)
+        return tracks + [gen_track(index + 1)]
+    if len(tracks) == 1:
+        raise dash.exceptions.PreventUpdate
+    index = json.loads(prop_id)["index"]
+    return [
+        track for track in tracks if track["props"]["id"]["index"] != index]
 
-    @app.callback(Output(f"cardInterest{i}", "children"),
-                  [Input(f'interest{i}', 'value')])
-    def render_interest(interest):
-        if interest:
-            return f'{interest} %'
 
-    @app.callback(Output(f"cardPeriod{i}", "children"),
-                  [Input(f'period{i}', 'value')])
-    def render_period(p):
-        return p
+@app.callback(
+    [
+        Output({"type": "output", "index": MATCH}, "figure"),
+        Output({"type": "pmt", "index": MATCH}, 'children'),
+        Output({"type": "total_pmt", "index": MATCH}, 'children')],
+    [
+        Input({"type": "schedule", "index": MATCH}, 'value'),
+        Input({"type": "switch", "index": MATCH}, 'value'),
+        Input({"type": "madad", "index": MATCH}, 'value'),
+        Input({"type": "amount", "index": MATCH}, 'value'),
+        Input({"type": "interest", "index": MATCH}, 'value'),
+        Input({"type": "period", "index": MATCH}, 'value'),
+        Input({"type": "output", "index": MATCH}, 'relayoutData')])
+def loan_value(schedule, cpi, madad, amount, i, period, relayout):
+    triggered = dash.callback_context.triggered
+    if (len(triggered) == 1 and triggered[0]["prop_id"].endswith(
+            ".relayoutData") and not changes_x_range(relayout)):
+        raise dash.exceptions.PreventUpdate
+    try:
+        track = schedule_cache.get(schedule, cpi, madad, amount, i, period)
+    except (TypeError, ValueError):
+        raise dash.exceptions.PreventUpdate
 
+    fig = schedule_figure(
+        track, ("pmt", "ppmt", "ipmt"), max_points=chart_points,
+        x_range=zoom_range(relayout))
+    return (
+        fig,
+        f"תשלום חודשי ראשוני:  {round(track.first_pmt, 2):,}",
+        f" החזר בסוף תקופה: {round(track.total_pmt, 1):,}")
+
+
+# Render loan description (clientside, see assets/clientside.js)
+for field, card, render in (
+        ("inputTitle", "cardTitle", "render_title"),
+        ("amount", "cardSum", "render_amount"),
+        ("interest", "cardInterest", "render_interest"),
+        ("period", "cardPeriod", "render_period")):
+    app.clientside_callback(
+        ClientsideFunction("cards", render),
+        Output({"type": card, "index": MATCH}, "children"),
+        [Input({"type": field, "index": MATCH}, 'value')])
 
 # Callbacks for loan modals
-def modal_callback(i):
-    @app.callback(
-        Output(f"modalmaslul{i}", "is_open"),
-        [Input(f"openmaslul{i}", "n_clicks"),
-         Input(f"closemaslul{i}", "n_clicks")],
-        [State(f"modalmaslul{i}", "is_open")],
-    )
-    def toggle_modal(n1, n2, is_open):
-        if n1 or n2:
-            return not is_open
-        return is_open
+app.clientside_callback(
+    ClientsideFunction("toggles", "toggle_modal"),
+    Output({"type": "modalmaslul", "index": MATCH}, "is_open"),
+    [Input({"type": "openmaslul", "index": MATCH}, "n_clicks"),
+     Input({"type": "closemaslul", "index": MATCH}, "n_clicks")],
+    [State({"type": "modalmaslul", "index": MATCH}, "is_open")],
+)
 
 
 # we use a callback to toggle the collapse on small screens
-def toggle_navbar_collapse(n, is_open):
-    if n:
-        return not is_open
-    return is_open
-
-
-# render callbacks
-for i in range(1, 7):
-    loan_callback(i)
-    card_callback(i)
-    modal_callback(i)
-
-
-# the same function (toggle_navbar_collapse) is used in all three callbacks
 for i in [2]:
-    app.callback(
+    app.clientside_callback(
+        ClientsideFunction("toggles", "toggle_navbar_collapse"),
         Output(f"navbar-collapse{i}", "is_open"),
         [Input(f"navbar-toggler{i}", "n_clicks")],
         [State(f"navbar-collapse{i}", "is_open")],
-    )(toggle_navbar_collapse)
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,33 @@
+// Callbacks that only echo an input or toggle a flag run in the browser,
+// so typing a track name or opening a modal never reaches the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    cards: {
+        render_title: function(t) {
+            return t ? t : null;
+        },
+        render_amount: function(a) {
+            return a ? a : null;
+        },
+        render_interest: function(interest) {
+            return interest ? interest + ' %' : null;
+        },
+        render_period: function(p) {
+            return p === undefined ? null : p;
+        }
+    },
+    toggles: {
+        // Shared by the loan modals and the navbar collapse.
+        toggle_modal: function(n1, n2, is_open) {
+            if (n1 || n2) {
+                return !is_open;
+            }
+            return is_open === undefined ? null : is_open;
+        },
+        toggle_navbar_collapse: function(n, is_open) {
+            if (n) {
+                return !is_open;
+            }
+            return is_open === undefined ? null : is_open;
+        }
+    }
+});
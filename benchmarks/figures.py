@@ -0,0 +1,81 @@
+"""Figure build time and payload size: cufflinks vs scripts.figures.
+
+    python -m benchmarks.figures
+"""
+import json
+import timeit
+
+import cufflinks  # noqa: F401  (registers DataFrame.iplot)
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+from scripts.figures import payments_figure, schedule_figure, sums_figure
+from scripts.mix_aggregator import MixAggregator
+from scripts.schedule_engine import ipmt_heb, months_heb, ppmt_heb, to_frame
+
+tracks = [
+    ('straight', [1], 1.48953, 100000 * n, 3, 70 * n) for n in range(1, 7)]
+arrays, total_ipmt_nominal, amount = MixAggregator().update(tracks)
+labels = ["קרן", "ריבית", "הצמדה"]
+values = [amount, round(total_ipmt_nominal), 1000]
+
+
+def cufflinks_figures():
+    # What the aggregate callback did before scripts.figures.
+    df_total = to_frame(arrays)
+    df_total.index += 1
+    fig = df_total.loc[:, df_total.columns != months_heb] \
+        .round(decimals=0).iplot(asFigure=True)
+    fig.update_layout(
+        title_text='title', title_x=0.5, paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)', legend_bgcolor='rgba(0,0,0,0)')
+    fig_sums = go.Figure(data=[go.Pie(labels=labels, values=values, hole=.2)])
+    fig_sums.update_layout(title_text='title', title_x=0.5)
+    fig_sums.update_traces(
+        hoverinfo='label', textposition='inside', textinfo='percent+value')
+    fig_payments = go.Figure(data=[
+        go.Bar(name=ipmt_heb, x=df_total[months_heb],
+               y=df_total[ipmt_heb].round(decimals=2)),
+        go.Bar(name=ppmt_heb, x=df_total[months_heb],
+               y=df_total[ppmt_heb].round(decimals=2))])
+    fig_payments.update_layout(
+        barmode='stack', title_text='title', title_x=0.5,
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+    return fig, fig_sums, fig_payments
+
+
+def builder_figures():
+    return (
+        schedule_figure(
+            arrays, ("ppmt", "ipmt", "pmt", "cumulative", "balance"),
+            title='title', decimals=0),
+        sums_figure(labels, values, title='title'),
+        payments_figure(arrays, title='title'),
+    )
+
+
+def payload(figures):
+    # Dash serializes figures with the same encoder.
+    return sum(len(json.dumps(fig, cls=PlotlyJSONEncoder)) for fig in figures)
+
+
+def measure(build, number=10):
+    seconds = min(timeit.repeat(build, number=number, repeat=3)) / number
+    return seconds * 1000, payload(build())
+
+
+def main():
+    # The builder's dicts must still be valid plotly figures.
+    for fig in builder_figures():
+        go.Figure(fig)
+    results = {
+        "cufflinks": measure(cufflinks_figures),
+        "scripts.figures": measure(builder_figures),
+    }
+    print(f"{'builder':<16}{'build ms':>10}{'payload bytes':>15}")
+    for name, (ms, size) in results.items():
+        print(f"{name:<16}{ms:>10.2f}{size:>15,}")
+
+
+if __name__ == "__main__":
+    main()
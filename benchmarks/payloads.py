@@ -0,0 +1,96 @@
+"""Response size of every server-side Dash callback, per update.
+
+    python -m benchmarks.payloads
+
+Posts each callback the dashboard fires for the six-track mix of
+benchmarks.suite and reports its JSON size with full-detail charts, with
+the sampled charts the app draws, and gzipped by Flask-Compress as a
+browser receives it.
+"""
+import app
+from benchmarks.suite import tracks
+
+fields = ("schedule", "switch", "madad", "amount", "interest", "period")
+
+
+def input_value(item, values):
+    # One input of a callback request; pattern-matching inputs get every
+    # track (ALL) or the first one (MATCH).
+    item_id = item["id"]
+    if not item_id.startswith("{"):
+        return dict(item, value=values.get(item_id, {}).get(item["property"]))
+    field = item_id.split('"type":"')[1].split('"')[0]
+    if field not in fields:
+        return dict(item, id={"index": 1, "type": field}, value=None)
+    position = fields.index(field)
+    if '["ALL"]' in item_id:
+        return [
+            {"id": {"index": index, "type": field},
+             "property": item["property"], "value": track[position]}
+            for index, track in enumerate(tracks, start=1)]
+    return dict(
+        item, id={"index": 1, "type": field}, value=tracks[0][position])
+
+
+def outputs_list(output):
+    # Concrete output ids of a callback, with MATCH resolved to track 1.
+    outputs = []
+    for spec in output.strip(".").split("..."):
+        component, prop = spec.rsplit(".", 1)
+        if component.startswith("{"):
+            field = component.split('"type":"')[1].split('"')[0]
+            component = {"index": 1, "type": field}
+        outputs.append({"id": component, "property": prop})
+    return outputs if output.startswith("..") else outputs[0]
+
+
+def measure(client, dependencies, values):
+    sizes = {}
+    for dependency in dependencies:
+        if dependency.get("clientside_function"):
+            continue
+        output = dependency["output"]
+        body = {
+            "output": output,
+            "outputs": outputs_list(output),
+            "inputs": [
+                input_value(item, values) for item in dependency["inputs"]],
+            "state": [
+                input_value(item, values) for item in dependency["state"]],
+            "changedPropIds": [],
+        }
+        raw = client.post("/_dash-update-component", json=body)
+        gzipped = client.post(
+            "/_dash-update-component", json=body,
+            headers={"Accept-Encoding": "gzip"})
+        if raw.status_code == 200:
+            sizes[output] = (len(raw.data), len(gzipped.data))
+            if "mix.data" in output:
+                values["mix"] = {
+                    "data": raw.get_json()["response"]["mix"]["data"]}
+    return sizes
+
+
+def main():
+    client = app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+    values = {"table": {"page_current": 0, "page_size": 12, "sort_by": []}}
+
+    chart_points = app.chart_points
+    app.chart_points = None
+    full = measure(client, dependencies, values)
+    app.chart_points = chart_points
+    sampled = measure(client, dependencies, values)
+
+    print(f"{'callback':<44}{'full':>10}{'sampled':>10}{'gzipped':>10}")
+    for output, (size, gzipped) in sampled.items():
+        name = output.strip(".").split("...")[0][:42]
+        print(f"{name:<44}{full[output][0]:>10,}{size:>10,}{gzipped:>10,}")
+    totals = [
+        sum(sizes[output][0] for output in sampled) for sizes in (full, sampled)]
+    gzipped = sum(sizes[1] for sizes in sampled.values())
+    print(f"{'total':<44}{totals[0]:>10,}{totals[1]:>10,}{gzipped:>10,}")
+
+
+if __name__ == "__main__":
+    main()
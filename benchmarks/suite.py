@@ -0,0 +1,237 @@
+"""Benchmark suite of the dashboard's hot paths, with stored baselines.
+
+    python -m benchmarks.suite                      # run, compare to baseline
+    python -m benchmarks.suite --output run.json    # results to a file
+    python -m benchmarks.suite --save-baseline      # store a new baseline
+    python -m benchmarks.suite --filter aggregate   # only matching cases
+
+Every case is timed with timeit; the best of `--repeat` runs, in ms per
+call, is what gets compared. A case regresses when it is more than
+`--threshold` times its baseline and slower by at least `--min-delta` ms,
+so sub-millisecond noise doesn't fail a run. Regressions exit with
+status 1. Baselines are only comparable on the machine they were saved on.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+from scripts.bullet_schedule import generate_pd_per_maslul_bullet
+from scripts.declining_schedule import generate_pd_per_maslul_declining
+from scripts.figures import payments_figure, schedule_figure, sums_figure
+from scripts.mix_aggregator import MixAggregator, aggregate_mix, summarize
+from scripts.schedule_cache import schedule_cache
+from scripts.schedule_engine import generate_schedule
+from scripts.schedule_table import table_columns, table_page
+from scripts.sensitivity import sensitivity
+from scripts.straight_schedule import generate_pd_per_maslul_straight
+
+baseline_path = os.path.join(os.path.dirname(__file__), "baseline.json")
+periods = (1, 12, 60, 120, 240, 360, 420)
+madad = 1.48953
+
+generators = {
+    "straight": generate_pd_per_maslul_straight,
+    "declining": generate_pd_per_maslul_declining,
+    "bullet": generate_pd_per_maslul_bullet,
+    "variable": lambda *args: generate_schedule("variable", *args),
+    "prime": lambda *args: generate_schedule("prime", *args),
+}
+
+# The dashboard's six slots, filled in as a user would.
+tracks = [
+    (schedule, [1], madad, 100000 * n, 2 + n / 2, 70 * n)
+    for n, schedule in enumerate(
+        ("straight", "declining", "bullet", "straight", "variable", "prime"),
+        start=1)]
+
+
+def generator_cases():
+    for schedule, generate in generators.items():
+        for period in periods:
+            yield (
+                f"generate/{schedule}/{period}",
+                lambda generate=generate, period=period: generate(
+                    [1], madad, 100000, 3, period))
+
+
+def aggregate_cases():
+    def cold():
+        # Every track priced: a fresh server or a full cache.
+        schedule_cache.clear()
+        return MixAggregator().update(tracks)
+
+    aggregator = MixAggregator()
+    aggregator.update(tracks)
+    edits = iter(range(sys.maxsize))
+
+    def edit():
+        # One slot's amount typed in; the other five are unchanged.
+        edited = list(tracks)
+        edited[0] = tracks[0][:3] + (100000 + next(edits) % 2,) + tracks[0][4:]
+        return aggregator.update(edited)
+
+    def mix():
+        # What a dashboard callback does: all cache hits, summed afresh.
+        return aggregate_mix(tracks)
+
+    yield "aggregate/cold", cold
+    yield "aggregate/edit", edit
+    yield "aggregate/mix", mix
+
+
+def build_cases():
+    arrays, total_ipmt_nominal, amount = MixAggregator().update(tracks)
+    sort_by = [{"column_id": "pmt", "direction": "desc"}]
+
+    def figures():
+        return (
+            schedule_figure(
+                arrays, ("ppmt", "ipmt", "pmt", "cumulative", "balance"),
+                title='title', decimals=0),
+            sums_figure(["a", "b", "c"], [amount, total_ipmt_nominal, 0]),
+            payments_figure(arrays, title='title'),
+        )
+
+    yield "build/summary", lambda: summarize(arrays, total_ipmt_nominal, amount)
+    yield "build/table", lambda: (
+        table_page(arrays, 0, 12), table_columns(arrays))
+    yield "build/table_sorted", lambda: table_page(arrays, 3, 12, sort_by)
+    yield "build/figures", figures
+    yield "build/sensitivity", lambda: sensitivity(tracks, 0)
+
+
+def callback_cases():
+    # The whole round trip of the aggregate and table callbacks, JSON
+    # included, through the Dash server.
+    from app import server
+
+    client = server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+    fields = ("schedule", "switch", "madad", "amount", "interest", "period")
+
+    def request_body(dependency, inputs):
+        return {
+            "output": dependency["output"], "outputs": None,
+            "inputs": inputs, "state": [], "changedPropIds": [],
+        }
+
+    # Each field of every track is one list input of the aggregate.
+    aggregate = next(
+        d for d in dependencies if "mix.data" in d["output"])
+    body = request_body(aggregate, [
+        [
+            {"id": {"index": index, "type": field}, "property": "value",
+             "value": track[position]}
+            for index, track in enumerate(tracks, start=1)]
+        for position, field in enumerate(fields)])
+    response = client.post("/_dash-update-component", json=body)
+    mix = response.get_json()["response"]["mix"]["data"]
+
+    table = next(d for d in dependencies if "table.data" in d["output"])
+    values = {"page_current": 0, "page_size": 12, "sort_by": [], "data": mix}
+    table_body = request_body(table, [
+        dict(item, value=values[item["property"]])
+        for item in table["inputs"]])
+
+    def post(body):
+        response = client.post("/_dash-update-component", json=body)
+        assert response.status_code == 200, response.status_code
+        return response
+
+    yield "callback/aggregate", lambda: post(body)
+    yield "callback/table", lambda: post(table_body)
+
+
+suites = (generator_cases, aggregate_cases, build_cases, callback_cases)
+
+
+def measure(function, repeat):
+    # Enough calls per run for ~0.1 s, as timeit's autorange does.
+    number, _ = timeit.Timer(function).autorange()
+    runs = timeit.repeat(function, number=number, repeat=repeat)
+    runs = [seconds / number * 1000 for seconds in runs]
+    return {"ms": min(runs), "median_ms": float(np.median(runs)),
+            "number": number}
+
+
+def environment():
+    import pandas
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pandas.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def run(pattern, repeat):
+    results = {}
+    for suite in suites:
+        for name, function in suite():
+            if pattern and pattern not in name:
+                continue
+            results[name] = measure(function, repeat)
+            print(f"{name:<28}{results[name]['ms']:>10.3f} ms",
+                  file=sys.stderr)
+    return {"environment": environment(), "cases": results}
+
+
+def compare(results, baseline, threshold, min_delta):
+    regressions = []
+    for name, result in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        ratio = result["ms"] / base["ms"]
+        result["baseline_ms"] = base["ms"]
+        result["ratio"] = ratio
+        if ratio > threshold and result["ms"] - base["ms"] >= min_delta:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--filter", help="only cases whose name has this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--min-delta", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat)
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(
+            results, baseline, args.threshold, args.min_delta)
+        for name in regressions:
+            case = results["cases"][name]
+            print(f"REGRESSION {name}: {case['ms']:.3f} ms, "
+                  f"{case['ratio']:.2f}x baseline {case['baseline_ms']:.3f} ms",
+                  file=sys.stderr)
+    results["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# gunicorn reads this file from the working directory on start.
+import glob
+import os
+import tempfile
+
+# Workers write their Prometheus metrics to files in this directory, for
+# /metrics to add up; it has to be set before any worker imports the app.
+if "prometheus_multiproc_dir" in os.environ:
+    for path in glob.glob(
+            os.path.join(os.environ["prometheus_multiproc_dir"], "*.db")):
+        os.remove(path)  # values of a previous run
+else:
+    os.environ["prometheus_multiproc_dir"] = tempfile.mkdtemp(
+        prefix="prometheus-")
+
+# Schedules computed by any worker are shared through this directory.
+if "SCHEDULE_CACHE_DIR" not in os.environ:
+    os.environ["SCHEDULE_CACHE_DIR"] = tempfile.mkdtemp(prefix="schedules-")
+
+# The annuity table is written here once per deployment, in a directory
+# only this user can write.
+if "ANNUITY_TABLE" not in os.environ:
+    os.environ["ANNUITY_TABLE"] = os.path.join(
+        tempfile.mkdtemp(prefix="annuity-"), "annuity.npy")
+
+# Background jobs are queued here for the deployment's one job runner,
+# which writes their state and results back for any worker to serve.
+if "JOBS_DIR" not in os.environ:
+    os.environ["JOBS_DIR"] = tempfile.mkdtemp(prefix="jobs-")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_starting(server):
+    # Write the annuity table once, before any worker maps it.
+    from scripts.annuity_table import get_table
+    get_table()
+
+
+def post_worker_init(worker):
+    from scripts.annuity_table import get_table
+    get_table()
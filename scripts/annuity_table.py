@@ -0,0 +1,114 @@
+"""Straight-track annuity factors over the dashboard's whole input grid.
+
+Interest is 0-10% in 0.01 steps and periods are 1-420 months, so the
+monthly payment per shekel of every straight track on that grid fits a
+1001 x 420 table. It is written once to an .npy file and memory-mapped by
+each worker (see gunicorn.conf.py), so all of them read one copy through
+the page cache. A worker builds the table in memory too and only maps a
+file with the same checksum, so a stale or planted file is replaced.
+Quoting a track on the grid is then a lookup plus the closed-form CPI
+growth sum, not a schedule.
+"""
+import hashlib
+import operator
+import os
+import tempfile
+
+import numpy as np
+
+from scripts.schedule_cache import schedule_cache
+from scripts.schedule_engine import get_minf, prime_rates
+from scripts.shared_cache import atomic_file
+
+rate_steps = 100  # per percent
+max_rate = 10
+max_period = 420
+table_path = os.environ.get("ANNUITY_TABLE") or os.path.join(
+    tempfile.gettempdir(), f"annuity-{rate_steps}-{max_rate}-{max_period}.npy")
+
+# Schedules that price as straight with a single rate.
+straight_schedules = ("straight", "variable", "prime")
+
+table = None
+
+
+def build_table():
+    # Same closed form as the engine's annuity_nominal.
+    rate = np.arange(max_rate * rate_steps + 1)[:, None] / rate_steps / 1200
+    period = np.arange(1, max_period + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temp = (1 + rate) ** period
+        return np.where(rate == 0, 1 / period, temp * rate / (temp - 1))
+
+
+def table_digest(values):
+    return hashlib.sha256(np.ascontiguousarray(values)).hexdigest()
+
+
+def load_table(expected):
+    # The mapped file, or None unless it holds exactly `expected`.
+    try:
+        loaded = np.load(table_path, mmap_mode="r")
+    except (OSError, ValueError, EOFError):  # missing, or not an array
+        return None
+    if (loaded.shape != expected.shape or loaded.dtype != expected.dtype
+            or table_digest(loaded) != table_digest(expected)):
+        return None
+    return loaded
+
+
+def get_table():
+    global table
+    if table is None:
+        expected = build_table()
+        table = load_table(expected)
+        if table is None:
+            try:
+                with atomic_file(table_path) as f:
+                    np.save(f, expected)
+            except OSError:  # e.g. another user's file in /tmp
+                pass
+            table = load_table(expected)
+        if table is None:
+            # Unshared, but right.
+            table = expected
+    return table
+
+
+def grid_row(interest):
+    # The table row of an annual rate, or None off the grid.
+    if np.ndim(interest):
+        return None
+    step = interest * rate_steps
+    row = round(step)
+    if abs(step - row) > 1e-9 or not 0 <= row <= max_rate * rate_steps:
+        return None
+    return row
+
+
+def growth_sum(minf, period):
+    # minf + minf ** 2 + ... + minf ** period, without the cancellation of
+    # minf - 1 when inflation is tiny.
+    inflation = minf - 1
+    if inflation == 0:
+        return period
+    return minf * np.expm1(period * np.log1p(inflation)) / inflation
+
+
+def quote(schedule, cpi, madad, amount, interest, period):
+    """First monthly payment and total of all payments of a track, from
+    the table when it is a straight track on the grid and from its
+    schedule otherwise."""
+    period = operator.index(period)
+    rate = prime_rates(interest, period) if schedule == "prime" else interest
+    row = grid_row(rate)
+    if (schedule in straight_schedules and row is not None
+            and np.ndim(madad) == 0 and 1 <= period <= max_period):
+        pmt_nominal = amount * get_table()[row, period - 1]
+        minf = get_minf(cpi, madad)
+        return {
+            "first_pmt": float(pmt_nominal * minf),
+            "total_pmt": float(pmt_nominal * growth_sum(minf, period)),
+        }
+    track = schedule_cache.get(schedule, cpi, madad, amount, interest, period)
+    return {"first_pmt": track.first_pmt, "total_pmt": track.total_pmt}
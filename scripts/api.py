@@ -0,0 +1,390 @@
+"""JSON/NumPy API over the schedule engine, mounted on the Dash server.
+
+A track takes the same fields as the dashboard inputs::
+
+    {"schedule": "straight", "linked": true, "madad": 1.48953,
+     "amount": 100000, "interest": 3, "period": 240}
+
+madad and interest may also be curves, a list with a value per month.
+Schedules are straight, declining and bullet, variable (re-amortized
+every 60 months on an interest curve) and prime, whose interest is the
+spread over the prime rate path (schedule_engine.prime_path) and which is
+re-amortized every month.
+
+POST /api/v1/schedule   {"track": {...}} or {"tracks": [{...}, ...]}
+POST /api/v1/portfolio  {"tracks": [...]} or {"portfolios": [{"tracks":
+                        [...]}, ...]}
+POST /api/v1/simulate   {"tracks": [...], "paths": 1000, "phi": 0.95,
+                        "sigma": 0.3, "seed": null}, Monte Carlo CPI bands
+POST /api/v1/quote      {"track": {...}} or {"tracks": [...]}, first and
+                        total payment only, O(1) for straight tracks
+POST /api/v1/what-if    {"track": {...}, "month": 60, "prepayment": 50000,
+                        "interest": 2.5}, the track after a prepayment
+                        and/or new rate with month 60's payment
+
+POST /api/v1/export.csv  {"tracks": [...]} or {"portfolios": [...]}, the
+                        full schedule of every track and of the mix,
+                        streamed; export.xlsx for a workbook, and GET
+                        with ?tracks=<JSON list> for a download link
+POST /api/v1/jobs       {"kind": "optimize", "params": {...}}, runs in the
+                        background and returns {"id": ...} at once; kinds
+                        are optimize (optimize_mix arguments), simulate
+                        (as /simulate) and portfolios (as /portfolio)
+GET  /api/v1/jobs/<id>  the job's state and progress, with its "result"
+                        once done
+
+Add ?format=npz for a NumPy .npz archive instead of JSON, with one array
+per "<index>/<schedule|summary>/<name>" entry.
+
+Amounts are positive, madad and interest numbers or lists of numbers,
+periods are 1 to 420 months, and a request takes at most `max_tracks`
+tracks per list and `max_portfolios` portfolios; anything else is a 400.
+"""
+import io
+import json
+
+from flask import Blueprint, Response, request
+import numpy as np
+
+from scripts.annuity_table import max_period, quote as quote_track
+from scripts import export, jobs
+from scripts.mix_aggregator import MixAggregator, summarize
+from scripts.monte_carlo import simulate_mix
+from scripts.schedule_cache import schedule_cache
+from scripts.what_if import what_if
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+default_madad = 1.48953  # the dashboard's default madad{i}
+max_paths = 20000
+# One request may not hold a worker or fill the caches: periods are the
+# dashboard's, and lists of tracks and portfolios are bounded.
+max_tracks = 100
+max_portfolios = 100
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def finite_number(value):
+    # JSON true/false load as bools, which are ints too.
+    return (
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        and np.isfinite(value))
+
+
+def number_or_curve(value):
+    if isinstance(value, list):
+        return bool(value) and all(finite_number(item) for item in value)
+    return finite_number(value)
+
+
+def track_params(track):
+    # The dashboard's switch{i} checklist is accepted as well as `linked`.
+    try:
+        linked = track.get("linked", bool(track.get("switch", [1])))
+        params = (
+            track.get("schedule", "straight"), [1] if linked else [],
+            track.get("madad", default_madad), track["amount"],
+            track["interest"], track["period"])
+    except (AttributeError, KeyError) as e:
+        raise BadRequest(f"bad track {track!r}: missing {e}")
+    _, _, madad, amount, interest, period = params
+    if not finite_number(amount) or amount <= 0:
+        raise BadRequest(f"bad track {track!r}: amount must be positive")
+    for name, value in (("madad", madad), ("interest", interest)):
+        if not number_or_curve(value):
+            raise BadRequest(
+                f"bad track {track!r}: {name} must be a number or a list"
+                " of numbers")
+    if (not isinstance(period, int) or isinstance(period, bool)
+            or not 1 <= period <= max_period):
+        raise BadRequest(
+            f"bad track {track!r}: period must be a whole number of months"
+            f" between 1 and {max_period}")
+    return params
+
+
+def bounded(items, name, limit):
+    # A list of the request body, at most `limit` long.
+    if not isinstance(items, list):
+        raise BadRequest(f"'{name}' must be a list")
+    if len(items) > limit:
+        raise BadRequest(f"at most {limit} {name} per request")
+    return items
+
+
+def get_schedule(params):
+    try:
+        return schedule_cache.get(*params)
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"bad track {params!r}: {e}")
+
+
+def price_track(track):
+    params = track_params(track)
+    schedule = get_schedule(params)
+    return {
+        "schedule": dict(schedule.items()),
+        "summary": summarize(
+            schedule, schedule.total_ipmt_nominal, params[3]),
+    }
+
+
+def price_portfolio(portfolio):
+    tracks = portfolio.get("tracks") if isinstance(portfolio, dict) else None
+    if not tracks:
+        raise BadRequest("a portfolio needs a non-empty 'tracks' list")
+    params = [
+        track_params(track)
+        for track in bounded(tracks, "tracks", max_tracks)]
+    for track in params:
+        get_schedule(track)
+    arrays, total_ipmt_nominal, amount = MixAggregator().update(params)
+    return {
+        "schedule": arrays,
+        "summary": summarize(arrays, total_ipmt_nominal, amount),
+    }
+
+
+def flatten(results, prefix=""):
+    for name, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}/")
+        else:
+            yield f"{prefix}{name}", value
+
+
+def encode(results):
+    if request.args.get("format") == "npz":
+        buffer = io.BytesIO()
+        if isinstance(results, list):
+            results = {str(index): result for index, result in enumerate(results)}
+        np.savez(buffer, **dict(flatten(results)))
+        return Response(buffer.getvalue(), mimetype="application/octet-stream")
+    try:
+        # NaN and Infinity aren't JSON; strict clients reject them.
+        body = json.dumps(
+            results, separators=(",", ":"), allow_nan=False,
+            default=lambda values: values.tolist())
+    except ValueError:
+        raise BadRequest("the inputs give results that aren't finite")
+    return Response(body, mimetype="application/json")
+
+
+def error(message):
+    body = json.dumps({"error": message})
+    return Response(body, status=400, mimetype="application/json")
+
+
+def get_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("expected a JSON object body")
+    return body
+
+
+@api.route("/schedule", methods=["POST"])
+def schedule():
+    try:
+        body = get_body()
+        if "tracks" in body:
+            return encode([
+                price_track(track)
+                for track in bounded(body["tracks"], "tracks", max_tracks)])
+        return encode(price_track(body.get("track", body)))
+    except BadRequest as e:
+        return error(str(e))
+
+
+def price_quote(track):
+    params = track_params(track)
+    try:
+        return quote_track(*params)
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"bad track {params!r}: {e}")
+
+
+@api.route("/quote", methods=["POST"])
+def quote():
+    try:
+        body = get_body()
+        if "tracks" in body:
+            return encode([
+                price_quote(track)
+                for track in bounded(body["tracks"], "tracks", max_tracks)])
+        return encode(price_quote(body.get("track", body)))
+    except BadRequest as e:
+        return error(str(e))
+
+
+@api.route("/portfolio", methods=["POST"])
+def portfolio():
+    try:
+        body = get_body()
+        if "portfolios" in body:
+            return encode([
+                price_portfolio(portfolio) for portfolio in bounded(
+                    body["portfolios"], "portfolios", max_portfolios)])
+        return encode(price_portfolio(body))
+    except BadRequest as e:
+        return error(str(e))
+
+
+@api.route("/simulate", methods=["POST"])
+def simulate():
+    try:
+        body = get_body()
+        tracks = body.get("tracks")
+        if not tracks:
+            raise BadRequest("a simulation needs a non-empty 'tracks' list")
+        params = [
+            track_params(track)
+            for track in bounded(tracks, "tracks", max_tracks)]
+        for track in params:
+            get_schedule(track)
+        try:
+            paths = int(body.get("paths", 1000))
+            seed = body.get("seed")
+            seed = None if seed is None else int(seed)
+            options = {
+                name: float(body[name])
+                for name in ("phi", "sigma") if name in body}
+        except (TypeError, ValueError) as e:
+            raise BadRequest(str(e))
+        if not 1 <= paths <= max_paths:
+            raise BadRequest(f"paths must be between 1 and {max_paths}")
+        return encode(simulate_mix(
+            params, paths, seed=seed, **options))
+    except BadRequest as e:
+        return error(str(e))
+
+
+@api.route("/what-if", methods=["POST"])
+def what_if_track():
+    try:
+        body = get_body()
+        params = track_params(body.get("track"))
+        get_schedule(params)
+        try:
+            arrays, total_ipmt_nominal = what_if(
+                *params, int(body["month"]), float(body.get("prepayment", 0)),
+                body.get("interest"))
+        except KeyError as e:
+            raise BadRequest(f"missing {e}")
+        except (TypeError, ValueError) as e:
+            raise BadRequest(str(e))
+        amount = params[3]
+        return encode({
+            "schedule": arrays,
+            "summary": summarize(arrays, total_ipmt_nominal, amount),
+        })
+    except BadRequest as e:
+        return error(str(e))
+
+
+def export_scenarios(body):
+    portfolios = bounded(
+        body.get("portfolios", [body]), "portfolios", max_portfolios)
+    scenarios = []
+    for portfolio in portfolios:
+        tracks = portfolio.get("tracks") if isinstance(portfolio, dict) else None
+        if not tracks:
+            raise BadRequest("a portfolio needs a non-empty 'tracks' list")
+        scenarios.append([
+            track_params(track)
+            for track in bounded(tracks, "tracks", max_tracks)])
+    # Priced before the response starts: once it streams, a bad track can
+    # only be left out. The schedules stay cached for the export.
+    for tracks in scenarios:
+        for params in tracks:
+            get_schedule(params)
+    return scenarios
+
+
+@api.route("/export.<file_format>", methods=["GET", "POST"])
+def export_schedule(file_format):
+    try:
+        if file_format not in export.formats:
+            raise BadRequest("the export formats are csv and xlsx")
+        if request.method == "GET":
+            try:
+                body = {"tracks": json.loads(request.args.get("tracks", ""))}
+            except ValueError as e:
+                raise BadRequest(f"bad 'tracks': {e}")
+        else:
+            body = get_body()
+        chunks, mimetype = export.formats[file_format]
+        # Flask-Compress would buffer the whole stream to gzip it; neither
+        # mimetype is in its list, so the chunks go out as they are made.
+        response = Response(chunks(export_scenarios(body)), mimetype=mimetype)
+        response.headers["Content-Disposition"] = (
+            f"attachment; filename=schedule.{file_format}")
+        return response
+    except BadRequest as e:
+        return error(str(e))
+
+
+def job_params(kind, body):
+    # Tracks are given as in the synchronous endpoints and checked here,
+    # so a bad one fails the request rather than the job.
+    params = body.get("params", {})
+    if not isinstance(params, dict):
+        raise BadRequest("'params' must be a JSON object")
+    if kind == "simulate":
+        tracks = params.get("tracks")
+        if not tracks:
+            raise BadRequest("a simulation needs a non-empty 'tracks' list")
+        params = dict(params, tracks=[
+            track_params(track)
+            for track in bounded(tracks, "tracks", max_tracks)])
+        if not 1 <= int(params.get("paths", 1000)) <= max_paths:
+            raise BadRequest(f"paths must be between 1 and {max_paths}")
+    elif kind == "portfolios":
+        portfolios = params.get("portfolios")
+        if not portfolios:
+            raise BadRequest("a job needs a non-empty 'portfolios' list")
+        params = {"portfolios": [
+            [track_params(track) for track in bounded(
+                portfolio.get("tracks") or [], "tracks", max_tracks)]
+            for portfolio in bounded(
+                portfolios, "portfolios", max_portfolios)]}
+        if not all(params["portfolios"]):
+            raise BadRequest("a portfolio needs a non-empty 'tracks' list")
+    elif kind == "optimize":
+        if "total" not in params or not params.get("offers"):
+            raise BadRequest("an optimization needs 'total' and 'offers'")
+    return params
+
+
+@api.route("/jobs", methods=["POST"])
+def submit_job():
+    try:
+        body = get_body()
+        kind = body.get("kind")
+        if kind not in jobs.kinds:
+            raise BadRequest(
+                f"kind must be one of {', '.join(sorted(jobs.kinds))}")
+        try:
+            job_id = jobs.submit(kind, job_params(kind, body))
+        except (AttributeError, TypeError, ValueError) as e:
+            raise BadRequest(str(e))
+        body = json.dumps({"id": job_id})
+        return Response(body, status=202, mimetype="application/json")
+    except BadRequest as e:
+        return error(str(e))
+
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        body = json.dumps({"error": f"no job {job_id}"})
+        return Response(body, status=404, mimetype="application/json")
+    if status["state"] == "done":
+        status["result"] = jobs.result(job_id)
+    try:
+        return encode(status)
+    except BadRequest as e:
+        return error(str(e))
@@ -0,0 +1,172 @@
+"""The full schedule of one or more mixes, as CSV or XLSX, streamed.
+
+Every track of every scenario comes out month by month, followed by the
+mix's totals, one block of rows at a time straight from the cached
+schedule arrays and the aggregator's totals. No DataFrame is built and
+no more than one block of text is held, so exports of many scenarios
+stay flat in memory.
+
+    Response(csv_chunks([tracks]), mimetype="text/csv")
+
+`scenarios` is a list of mixes, each a list of (schedule, cpi, madad,
+amount, interest, period) tracks; tracks that can't be priced are left
+out, as in the dashboard (the API rejects them before it streams).
+"""
+import csv
+import io
+from xml.sax.saxutils import escape
+import zipfile
+
+import numpy as np
+
+from scripts.mix_aggregator import MixAggregator
+from scripts.schedule_cache import schedule_cache
+from scripts.schedule_engine import columns_heb
+
+scenario_heb = "תרחיש"
+track_heb = "מסלול"
+total_heb = 'סה"כ'
+
+header = [scenario_heb, track_heb] + list(columns_heb.values())
+
+
+def blocks(scenarios):
+    # (scenario, track label, arrays) of every track, then the totals.
+    for scenario, tracks in enumerate(scenarios, start=1):
+        mix = MixAggregator().update(tracks)
+        if mix is None:
+            continue
+        for index, params in enumerate(tracks, start=1):
+            try:
+                schedule = schedule_cache.get(*params)
+            except (TypeError, ValueError):
+                continue
+            yield scenario, str(index), schedule
+        yield scenario, total_heb, mix[0]
+
+
+def row_blocks(scenarios):
+    """Rows of the export, one list of rows per track; columns a schedule
+    doesn't have (bullet has no cumulative) are None."""
+    for scenario, label, arrays in blocks(scenarios):
+        months = arrays["months"]
+        columns = [
+            np.round(arrays[name], 2).tolist() if name in arrays
+            else [None] * len(months)
+            for name in columns_heb if name != "months"]
+        yield [
+            [scenario, label, month, *values]
+            for month, *values in zip(months.tolist(), *columns)]
+
+
+def csv_chunks(scenarios):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM makes Excel read the Hebrew headers as UTF-8.
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    for rows in row_blocks(scenarios):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class Chunks:
+    # A write-only stream for ZipFile: what it writes is collected until
+    # taken. Without tell() and seek() ZipFile writes a streamable archive.
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+xlsx_parts = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType='
+        '"application/vnd.openxmlformats-officedocument.spreadsheetml.'
+        'worksheet+xml"/></Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships"><Relationship Id="rId1" Type="http://'
+        'schemas.openxmlformats.org/officeDocument/2006/relationships/'
+        'officeDocument" Target="xl/workbook.xml"/></Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/'
+        'spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.'
+        'org/officeDocument/2006/relationships"><sheets><sheet name='
+        '"schedule" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships"><Relationship Id="rId1" Type="http://'
+        'schemas.openxmlformats.org/officeDocument/2006/relationships/'
+        'worksheet" Target="worksheets/sheet1.xml"/></Relationships>'),
+}
+
+sheet_start = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+    '2006/main"><sheetViews><sheetView rightToLeft="1" workbookViewId="0"/>'
+    '</sheetViews><sheetData>')
+sheet_end = '</sheetData></worksheet>'
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{escape(value)}</t></is></c>'
+    return f'<c><v>{value!r}</v></c>'
+
+
+def xlsx_rows(rows):
+    return "".join(
+        "<row>" + "".join(xlsx_cell(value) for value in row) + "</row>"
+        for row in rows).encode()
+
+
+def xlsx_chunks(scenarios):
+    """A one-sheet workbook of the export, with inline strings so it can
+    be written in a single pass."""
+    stream = Chunks()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, text in xlsx_parts.items():
+            archive.writestr(name, text)
+        with archive.open(
+                "xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(sheet_start.encode() + xlsx_rows([header]))
+            for rows in row_blocks(scenarios):
+                sheet.write(xlsx_rows(rows))
+                yield stream.take()
+            sheet.write(sheet_end.encode())
+    yield stream.take()
+
+
+formats = {
+    "csv": (csv_chunks, "text/csv"),
+    "xlsx": (xlsx_chunks, "application/vnd.openxmlformats-officedocument."
+                          "spreadsheetml.sheet"),
+}
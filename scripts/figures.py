@@ -0,0 +1,250 @@
+import copy
+
+import numpy as np
+import plotly.graph_objects as go
+
+from scripts.metrics import figure_seconds
+from scripts.schedule_engine import columns_heb
+
+# Line colours and axis styling of the cufflinks "pearl" theme the charts
+# were drawn with. Layouts are validated by plotly once, here, and every
+# callback gets a copy of the resulting dict: building a go.Figure costs
+# tens of milliseconds, a dict figure next to nothing, and dcc.Graph takes
+# either. The template is also far smaller than plotly's default one.
+line_colors = [
+    '#ff9933', '#3780bf', '#32ab60', '#800080', '#db4052', '#008080']
+axis = dict(
+    gridcolor='#E1E5ED', zerolinecolor='#E1E5ED', showgrid=True,
+    tickfont=dict(color='#4D5663'))
+template = go.layout.Template(layout=dict(
+    colorway=line_colors,
+    font=dict(color='#4D5663'),
+    title=dict(x=0.5),
+    xaxis=axis,
+    yaxis=axis,
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor='rgba(0,0,0,0)',
+    legend=dict(bgcolor='rgba(0,0,0,0)'),
+))
+pie_colors = ['#636efa', '#EF553B', '#00cc96']
+
+# A constant uirevision keeps the user's zoom when a callback sends the
+# chart a new figure, such as the full-detail redraw of the zoomed range.
+line_layout = go.Layout(
+    template=template, uirevision='schedule').to_plotly_json()
+bar_layout = go.Layout(
+    template=template, barmode='stack', uirevision='schedule').to_plotly_json()
+pie_layout = go.Layout(
+    template=template, paper_bgcolor='white').to_plotly_json()
+
+
+def zoom_range(relayout):
+    # The months a user zoomed a chart to, from its relayoutData.
+    if not relayout:
+        return None
+    if "xaxis.range[0]" in relayout:
+        return relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    if "xaxis.range" in relayout:
+        return tuple(relayout["xaxis.range"])
+    return None
+
+
+def changes_x_range(relayout):
+    # Plotly also reports autosize, legend clicks and y zooms; only a zoom
+    # or reset of the x axis changes what the server draws.
+    return any(
+        key.startswith("xaxis.range") or key == "xaxis.autorange"
+        for key in relayout or ())
+
+
+def in_range(months, x_range):
+    if x_range is None:
+        return np.zeros(len(months), dtype=bool)
+    return (months >= x_range[0]) & (months <= x_range[1])
+
+
+def sample_rows(values, max_points):
+    # The rows of a line worth drawing: the first and last and the min and
+    # max of every bucket of rows, so peaks and drops survive.
+    length = len(values)
+    if length <= max_points:
+        return np.arange(length)
+    size = -(-length // (max_points // 2))
+    buckets = -(-length // size)
+    blocks = np.full(buckets * size, np.nan)
+    blocks[:length] = values
+    blocks = blocks.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    return np.unique(np.concatenate((
+        [0, length - 1],
+        offsets + np.nanargmin(blocks, axis=1),
+        offsets + np.nanargmax(blocks, axis=1))))
+
+
+def line_rows(months, values, max_points, x_range):
+    # Sampled rows everywhere, plus the zoomed-in range sampled on its own
+    # so it shows full detail. The rest stays drawn in case the range is
+    # stale.
+    rows = sample_rows(values, max_points)
+    detail = np.flatnonzero(in_range(months, x_range))
+    if len(detail):
+        rows = np.union1d(
+            rows, detail[sample_rows(values[detail], max_points)])
+    return rows
+
+
+def yearly_bars(months, columns, max_points, x_range):
+    # Bars averaged per year, each as wide as its months, except the
+    # zoomed-in months when they fit. Returns x, widths and the columns.
+    detail = in_range(months, x_range)
+    if detail.sum() > max_points:
+        detail[:] = False
+    # A bar per run of consecutive months within a year, so a year the
+    # zoomed-in months cut in two gets a bar on each side of them.
+    rest = months[~detail]
+    starts = np.ones(len(rest), dtype=bool)
+    starts[1:] = (np.diff(rest) != 1) | (np.diff((rest - 1) // 12) != 0)
+    groups = np.cumsum(starts) - 1
+    counts = np.bincount(groups)
+    mean = lambda values: np.bincount(groups, values) / counts
+    x = np.concatenate((mean(months[~detail]), months[detail]))
+    widths = np.concatenate((counts, np.ones(detail.sum(), dtype=int)))
+    columns = [
+        np.concatenate((mean(values[~detail]), values[detail]))
+        for values in columns]
+    return x, widths, columns
+
+
+def get_layout(layout, title):
+    layout = copy.deepcopy(layout)
+    if title is not None:
+        layout["title"] = {"text": title}
+    return layout
+
+
+def zoomed_layout(layout, title, x_range):
+    layout = get_layout(layout, title)
+    if x_range is not None:
+        layout["xaxis"] = {"range": list(x_range)}
+    return layout
+
+
+@figure_seconds.labels("schedule").time()
+def schedule_figure(
+        arrays, names, title=None, decimals=2, gl=False, max_points=None,
+        x_range=None):
+    # One line per schedule column, months on the x axis. With max_points
+    # each line is sampled down to about that many points, in full detail
+    # within the zoomed x_range.
+    months = arrays["months"]
+    traces = []
+    for name in names:
+        if name not in arrays:
+            continue
+        values = arrays[name]
+        rows = slice(None)
+        if max_points:
+            rows = line_rows(months, values, max_points, x_range)
+        traces.append({
+            "type": "scattergl" if gl else "scatter",
+            "mode": "lines",
+            "name": columns_heb[name],
+            "x": months[rows],
+            "y": np.round(values[rows], decimals),
+            "line": {"width": 1.3},
+        })
+    return {
+        "data": traces, "layout": zoomed_layout(line_layout, title, x_range)}
+
+
+@figure_seconds.labels("payments").time()
+def payments_figure(arrays, title=None, max_points=None, x_range=None):
+    # Past max_points months the bars are yearly averages of the monthly
+    # payments, with monthly bars within the zoomed x_range.
+    names = ("ipmt", "ppmt")
+    months = arrays["months"]
+    columns = [arrays[name] for name in names]
+    widths = None
+    if max_points and len(months) > max_points:
+        months, widths, columns = yearly_bars(
+            months, columns, max_points, x_range)
+    traces = []
+    for name, values, color in zip(
+            names, columns, ('rgb(90, 202, 138)', 'rgb(250, 131, 210)')):
+        trace = {
+            "type": "bar",
+            "name": columns_heb[name],
+            "x": months,
+            "y": np.round(values, 2),
+            "marker": {"color": color},
+        }
+        if widths is not None:
+            trace["width"] = widths
+        traces.append(trace)
+    return {
+        "data": traces, "layout": zoomed_layout(bar_layout, title, x_range)}
+
+
+@figure_seconds.labels("sums").time()
+def sums_figure(labels, values, title=None):
+    trace = {
+        "type": "pie",
+        "labels": labels,
+        "values": values,
+        "hole": .2,
+        "marker": {"colors": pie_colors},
+        "hoverinfo": "label",
+        "textposition": "inside",
+        "textinfo": "percent+value",
+    }
+    return {"data": [trace], "layout": get_layout(pie_layout, title)}
+
+
+@figure_seconds.labels("band").time()
+def band_figure(months, bands, labels, title=None, max_points=None):
+    # A shaded band between the low and high percentile with the median
+    # line drawn over it. The three lines are sampled at the same months
+    # so the band's edges line up.
+    if max_points:
+        rows = np.unique(np.concatenate([
+            sample_rows(band, max_points) for band in bands]))
+        months, bands = months[rows], [band[rows] for band in bands]
+    low, median, high = (np.round(band, 2) for band in bands)
+    line = {"width": 0, "color": line_colors[1]}
+    traces = [
+        {"type": "scatter", "mode": "lines", "name": labels[0],
+         "x": months, "y": low, "line": line},
+        {"type": "scatter", "mode": "lines", "name": labels[2],
+         "x": months, "y": high, "line": line, "fill": "tonexty",
+         "fillcolor": "rgba(55, 128, 191, 0.2)"},
+        {"type": "scatter", "mode": "lines", "name": labels[1],
+         "x": months, "y": median,
+         "line": {"width": 1.3, "color": line_colors[1]}},
+    ]
+    return {"data": traces, "layout": get_layout(line_layout, title)}
+
+
+@figure_seconds.labels("heatmap").time()
+def heatmap_figure(
+        x, y, z, title=None, x_title=None, y_title=None, marker=None):
+    # z has a row per y and a column per x; marker is an (x, y) point to
+    # circle, such as the current inputs.
+    traces = [{
+        "type": "heatmap",
+        "x": x,
+        "y": y,
+        "z": np.round(z),
+        "colorscale": "Blues",
+        "hovertemplate": "%{x}, %{y}: %{z:,}<extra></extra>",
+    }]
+    if marker is not None:
+        traces.append({
+            "type": "scatter", "mode": "markers", "showlegend": False,
+            "x": [marker[0]], "y": [marker[1]], "hoverinfo": "skip",
+            "marker": {"size": 12, "color": "rgba(0,0,0,0)",
+                       "line": {"width": 2, "color": line_colors[0]}},
+        })
+    layout = get_layout(line_layout, title)
+    layout["xaxis"] = {"title": {"text": x_title}}
+    layout["yaxis"] = {"title": {"text": y_title}}
+    return {"data": traces, "layout": layout}
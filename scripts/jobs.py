@@ -0,0 +1,270 @@
+"""Heavy computations run as background jobs, off the request path.
+
+submit() queues a job as JSON files under $JOBS_DIR (see gunicorn.conf.py)
+and returns its id at once, so the callback or request that started it
+doesn't hold a gunicorn worker until it times out. One runner per host
+(`python -m scripts.jobs`, which submit() starts when no runner holds the
+lock file) takes the queued jobs oldest first and runs each in a niced
+process of its own. The job writes its state and progress, then its
+result, next to its parameters, so a poll served by any worker finds them.
+
+    job_id = submit("optimize", {"total": 1000000, "offers": [...]})
+    status(job_id)  # {"state": "running", "progress": 0.4, ...}
+    result(job_id)  # once the state is "done"
+
+Kinds are "optimize" (optimize_mix keyword arguments), "simulate"
+(simulate_mix keyword arguments) and "portfolios" ({"portfolios": [[track,
+...], ...]}, each priced as a mix), with tracks as (schedule, cpi, madad,
+amount, interest, period). Searches are bounded by check_search, and a
+job still running after `job_deadline` seconds is killed and fails. A
+finished job's files are deleted `max_age` seconds after it ended; a
+queued one waits for as long as the jobs ahead of it take.
+"""
+import fcntl
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from scripts.mix_aggregator import MixAggregator, summarize
+from scripts.monte_carlo import simulate_mix
+from scripts.optimizer import check_search, optimize_mix
+from scripts.shared_cache import atomic_file
+
+jobs_dir = os.environ.get("JOBS_DIR") or os.path.join(
+    tempfile.gettempdir(), "mortgage-jobs")
+max_age = int(os.environ.get("JOBS_MAX_AGE", 3600))
+# Processes a job may use, half the cores by default, so interactive
+# callbacks keep the rest.
+pool_workers = int(
+    os.environ.get("JOBS_WORKERS") or max(1, (os.cpu_count() or 2) // 2))
+job_nice = 10
+# A job still running after this many seconds fails, freeing its processes.
+job_deadline = int(os.environ.get("JOBS_DEADLINE", 120))
+runner_poll = 0.2  # seconds between looks at the queue
+runner_idle = 60  # seconds without a job before the runner exits
+finished = ("done", "failed")
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_optimize(params, progress):
+    # Jobs run one at a time, so the search fans out over the job processes.
+    return optimize_mix(**params, workers=pool_workers, progress=progress)
+
+
+def run_simulate(params, progress):
+    return simulate_mix(**params)
+
+
+def run_portfolios(params, progress):
+    portfolios = params["portfolios"]
+    results = []
+    for done, tracks in enumerate(portfolios, start=1):
+        arrays, total_ipmt_nominal, amount = MixAggregator().update(tracks)
+        results.append({
+            "schedule": arrays,
+            "summary": summarize(arrays, total_ipmt_nominal, amount),
+        })
+        progress(done / len(portfolios))
+    return results
+
+
+kinds = {
+    "optimize": run_optimize,
+    "simulate": run_simulate,
+    "portfolios": run_portfolios,
+}
+
+
+def path(job_id, suffix=""):
+    return os.path.join(jobs_dir, f"{job_id}{suffix}.json")
+
+
+def write(file_path, data):
+    with atomic_file(file_path, "w") as f:
+        json.dump(
+            data, f, separators=(",", ":"),
+            default=lambda values: values.tolist())
+
+
+def read(file_path):
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except FileNotFoundError:  # unknown, or expired
+        return None
+
+
+def fail(state, error):
+    write(path(state["id"]), dict(state, state="failed", error=error))
+
+
+def run_job(job_id):
+    # In the job's own process, which leads a process group so that the
+    # deadline kills the optimizer's processes along with it.
+    os.setpgid(0, 0)
+    state = {
+        name: value for name, value in read(path(job_id)).items()
+        if name in ("id", "kind", "submitted")}
+
+    def progress(fraction):
+        write(path(job_id), dict(
+            state, state="running", progress=round(fraction, 3)))
+
+    progress(0)
+    try:
+        results = kinds[state["kind"]](
+            read(path(job_id, ".params")), progress)
+    except Exception as e:
+        fail(state, f"{type(e).__name__}: {e}")
+        return
+    write(path(job_id, ".result"), results)
+    write(path(job_id), dict(state, state="done", progress=1))
+
+
+def run_next(state):
+    process = multiprocessing.get_context("fork").Process(
+        target=run_job, args=(state["id"],))
+    process.start()
+    process.join(job_deadline)
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:  # killed before it had its group
+            process.kill()
+        process.join()
+        fail(state, f"the job ran past its {job_deadline} s deadline")
+    elif process.exitcode != 0:
+        fail(state, f"the job's process exited with code {process.exitcode}")
+
+
+def take_lock():
+    # The runner holds an exclusive lock on this file while it runs, so
+    # there is one per host; the lock goes with its process.
+    lock = open(os.path.join(jobs_dir, "runner.lock"), "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def run_runner():
+    """Run queued jobs one at a time until none came for `runner_idle`
+    seconds. Returns at once if another runner has the lock."""
+    os.makedirs(jobs_dir, exist_ok=True)
+    lock = take_lock()
+    if lock is None:
+        return
+    os.nice(job_nice)
+    # Jobs another runner was running when it died will never finish.
+    for state, _ in job_states("running"):
+        fail(state, "the job's runner stopped")
+    idle_since = time.monotonic()
+    while True:
+        queued = job_states("queued")
+        if queued:
+            run_next(queued[0][0])
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since < runner_idle:
+            time.sleep(runner_poll)
+        else:
+            # A job submitted while the lock was still held started no
+            # runner, so look once more after letting go of it.
+            lock.close()
+            if not job_states("queued"):
+                return
+            lock = take_lock()
+            if lock is None:
+                return
+            idle_since = time.monotonic()
+
+
+def start_runner():
+    # Started as a new program, not forked from this threaded worker, and
+    # in a session of its own so it outlives it. Two submits may both start
+    # one; the second finds the lock taken and exits.
+    lock = take_lock()
+    if lock is None:
+        return
+    lock.close()
+    subprocess.Popen(
+        [sys.executable, "-m", "scripts.jobs"], cwd=root,
+        stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+def submit(kind, params):
+    """Queue a job and return its id."""
+    if kind not in kinds:
+        raise ValueError(f"unknown job kind {kind!r}")
+    if kind == "optimize":
+        check_search(**params)
+    os.makedirs(jobs_dir, exist_ok=True)
+    expire()
+    job_id = uuid.uuid4().hex
+    # The parameters first: the runner takes a job by its queued state.
+    write(path(job_id, ".params"), params)
+    write(path(job_id), {
+        "id": job_id, "kind": kind, "submitted": time.time(),
+        "state": "queued", "progress": 0})
+    start_runner()
+    return job_id
+
+
+def status(job_id):
+    """The job's state, progress and error, or None for an unknown id."""
+    if not valid_id(job_id):
+        return None
+    return read(path(job_id))
+
+
+def result(job_id):
+    """The job's result once it is done, else None."""
+    if not valid_id(job_id):
+        return None
+    return read(path(job_id, ".result"))
+
+
+def valid_id(job_id):
+    # Ids come from clients; only uuid hex names files.
+    return (
+        isinstance(job_id, str) and len(job_id) == 32
+        and all(c in "0123456789abcdef" for c in job_id))
+
+
+def job_states(*states):
+    # (state, directory entry) of the jobs in one of `states`, oldest first.
+    found = []
+    for entry in os.scandir(jobs_dir):
+        job_id, suffix = entry.name[:32], entry.name[32:]
+        if suffix != ".json" or not valid_id(job_id):
+            continue
+        state = read(entry.path)
+        if state is not None and state["state"] in states:
+            found.append((state, entry))
+    found.sort(key=lambda job: job[0]["submitted"])
+    return found
+
+
+def expire():
+    # Only finished jobs: a queued one may be waiting behind a long one.
+    cutoff = time.time() - max_age
+    for state, entry in job_states(*finished):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            for suffix in (".params", ".result", ""):
+                if os.path.exists(path(state["id"], suffix)):
+                    os.remove(path(state["id"], suffix))
+        except FileNotFoundError:  # expired by another worker just now
+            pass
+
+
+if __name__ == "__main__":
+    run_runner()
@@ -0,0 +1,92 @@
+"""Prometheus metrics of the dashboard, served on /metrics.
+
+Every Dash callback request is timed end to end (the callback plus the
+JSON encoding of its outputs) and counted with its response size,
+labelled with the callback's function name and first output. Schedule
+generation, the schedule cache and the figure builders record their own
+metrics through the objects below.
+
+Under gunicorn each worker keeps its own values, so they are written to
+files in $prometheus_multiproc_dir (see gunicorn.conf.py) and /metrics
+adds them up across workers. Without it, /metrics reports this process.
+Clientside callbacks run in the browser and are not seen here.
+"""
+import os
+import time
+
+from flask import Blueprint, Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess)
+
+# Callbacks go from a millisecond (a table page) to seconds (cold pricing
+# of six long tracks on a busy worker).
+latency_buckets = (
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+size_buckets = (1e2, 1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+callback_seconds = Histogram(
+    "dash_callback_seconds", "Dash callback request latency",
+    ["callback", "output"], buckets=latency_buckets)
+callback_exceptions = Counter(
+    "dash_callback_exceptions_total", "Dash callbacks that raised",
+    ["callback", "output"])
+callback_bytes = Histogram(
+    "dash_callback_response_bytes", "Dash callback response size",
+    ["callback", "output"], buckets=size_buckets)
+schedule_seconds = Histogram(
+    "schedule_generate_seconds", "Time to price one track", ["schedule"],
+    buckets=latency_buckets)
+figure_seconds = Histogram(
+    "figure_build_seconds", "Time to build one figure", ["figure"],
+    buckets=latency_buckets)
+cache_events = Counter(
+    "schedule_cache_events_total", "Schedule cache hits, misses and evictions",
+    ["event"])
+
+metrics = Blueprint("metrics", __name__)
+
+
+def callback_labels(app):
+    # Dash posts the callback's output id, e.g. "..a.figure...b.figure.."
+    # for several outputs.
+    output = (request.get_json(silent=True) or {}).get("output", "")
+    callback = app.callback_map.get(output, {}).get("callback")
+    name = getattr(callback, "__name__", "unknown")
+    return name, output.strip(".").split("...")[0]
+
+
+def instrument(app):
+    """Record callback metrics of the Dash `app` and serve /metrics on
+    its Flask server."""
+    dispatch_path = f"{app.config.requests_pathname_prefix}_dash-update-component"
+
+    @metrics.before_app_request
+    def start_timer():
+        if request.path == dispatch_path:
+            g.callback_start = time.perf_counter()
+
+    @metrics.after_app_request
+    def record_callback(response):
+        start = g.pop("callback_start", None)
+        if start is not None:
+            labels = callback_labels(app)
+            callback_seconds.labels(*labels).observe(
+                time.perf_counter() - start)
+            callback_bytes.labels(*labels).observe(
+                response.calculate_content_length() or 0)
+            if response.status_code >= 500:
+                callback_exceptions.labels(*labels).inc()
+        return response
+
+    app.server.register_blueprint(metrics)
+
+
+@metrics.route("/metrics")
+def serve_metrics():
+    registry = REGISTRY
+    if "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
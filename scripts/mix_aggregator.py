@@ -0,0 +1,157 @@
+import threading
+
+import numpy as np
+
+from scripts.schedule_cache import schedule_cache, track_key
+
+summed_arrays = ("ppmt", "ipmt", "pmt", "cumulative", "balance")
+
+
+def mix_keys(tracks):
+    # JSON friendly keys of every slot, None where the track is invalid.
+    # The cache key folds len(cpi) into madad; it is kept as well, since
+    # the Monte Carlo bands only move linked tracks.
+    keys = []
+    for params in tracks:
+        try:
+            keys.append(list(track_key(*params)) + [len(params[1])])
+        except Exception:
+            keys.append(None)
+    return keys
+
+
+def key_params(key):
+    # Back from a key to update() inputs.
+    if key is None:
+        return None
+    schedule, inflation, amount, interest, period, linked = key
+    madad = inflation if linked < 2 else np.divide(inflation, linked)
+    return schedule, [1] * linked, madad, amount, interest, period
+
+
+def summarize(arrays, total_ipmt_nominal, amount):
+    # The figures of the dashboard's summary table.
+    pmt = arrays["pmt"]
+    total_pmt = pmt.sum()
+    total_cpi = total_pmt - amount - total_ipmt_nominal
+    if total_cpi <= 2:
+        total_cpi = 0
+    return {
+        "amount": amount,
+        "first_pmt": pmt[0],
+        "max_pmt": pmt.max(),
+        "total_pmt": total_pmt,
+        "pmt_per_shekel": total_pmt / amount,
+        "total_ipmt": total_ipmt_nominal,
+        "total_cpi": total_cpi,
+    }
+
+
+class Track:
+    __slots__ = ("key", "arrays", "total_ipmt_nominal", "amount")
+
+    def __init__(self, key, arrays, total_ipmt_nominal, amount):
+        self.key = key
+        self.arrays = arrays
+        self.total_ipmt_nominal = total_ipmt_nominal
+        self.amount = amount
+
+    @property
+    def period(self):
+        return self.arrays.period
+
+
+class MixAggregator:
+    """Running month-by-month totals of a mix of tracks.
+
+    `update` takes the inputs of every track slot, diffs them against the
+    slots it saw last and only subtracts/adds the contributions of tracks
+    that changed. Shorter tracks add nothing after their last month, the
+    same as DataFrame.add(..., fill_value=0) did. An instance belongs to
+    one mix: fed another mix's edits in between, every update turns into a
+    full re-aggregation and the +/- steps drift its totals. Callers that
+    serve many mixes use aggregate_mix().
+    """
+
+    def __init__(self):
+        self._tracks = []
+        self._totals = {name: np.zeros(0) for name in summed_arrays}
+        self._lock = threading.Lock()
+
+    def _get_track(self, params):
+        # A track whose inputs can't be priced (empty field, bad period...)
+        # is left out of the mix, as before.
+        if params is None:
+            return None
+        try:
+            key = track_key(*params)
+            schedule = schedule_cache.get(*params)
+        except Exception:
+            return None
+        return Track(key, schedule, schedule.total_ipmt_nominal, params[3])
+
+    def _apply(self, track, sign):
+        period = track.period
+        if period > len(self._totals["pmt"]):
+            for name, totals in self._totals.items():
+                self._totals[name] = np.pad(totals, (0, period - len(totals)))
+        for name in summed_arrays:
+            if name in track.arrays:
+                self._totals[name][:period] += sign * track.arrays[name]
+
+    def update(self, tracks):
+        """Price `tracks`, a list of (schedule, cpi, madad, amount,
+        interest, period) per slot, and return (arrays, total_ipmt_nominal,
+        amount) for the mix, or None if no track could be priced."""
+        with self._lock:
+            if len(tracks) < len(self._tracks):
+                for track in self._tracks[len(tracks):]:
+                    if track is not None:
+                        self._apply(track, -1)
+                del self._tracks[len(tracks):]
+            self._tracks += [None] * (len(tracks) - len(self._tracks))
+
+            for slot, params in enumerate(tracks):
+                old = self._tracks[slot]
+                if old is None and params is None:
+                    continue
+                try:
+                    if old is not None and old.key == track_key(*params):
+                        old.amount = params[3]
+                        continue
+                except Exception:
+                    pass
+                new = self._get_track(params)
+                if old is not None:
+                    self._apply(old, -1)
+                if new is not None:
+                    self._apply(new, 1)
+                self._tracks[slot] = new
+
+            active = [track for track in self._tracks if track is not None]
+            if not active:
+                for totals in self._totals.values():
+                    totals[:] = 0
+                return None
+            # Whatever drifted past the longest track is exactly zero again.
+            length = max(track.period for track in active)
+            for totals in self._totals.values():
+                totals[length:] = 0
+
+            arrays = {"months": np.arange(1, length + 1)}
+            for name in summed_arrays:
+                if any(name in track.arrays for track in active):
+                    arrays[name] = self._totals[name][:length].copy()
+            total_ipmt_nominal = 0
+            amount = 0
+            for track in active:
+                total_ipmt_nominal += track.total_ipmt_nominal
+                amount += track.amount
+        return arrays, total_ipmt_nominal, amount
+
+
+def aggregate_mix(tracks):
+    """MixAggregator.update() with no state kept between calls: the mix is
+    summed from the cached schedules of `tracks` alone, so concurrent
+    sessions never see each other's slots."""
+    return MixAggregator().update(tracks)
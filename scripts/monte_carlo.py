@@ -0,0 +1,88 @@
+"""Monte Carlo CPI scenarios for a mix of tracks.
+
+Instead of one constant annual madad, monthly annual-inflation rates
+follow a mean-reverting AR(1) around each track's madad:
+
+    inflation[t] = madad + deviation[t]
+    deviation[t] = phi * deviation[t - 1] + sigma * shock[t]
+
+The deviations are drawn once and shared by every track, as all of them
+are indexed to the same CPI; a madad curve is then the mean path. Each
+track is priced against all paths at once by the schedule kernels, with
+the growth factors taken as cumulative products along each path.
+"""
+import numpy as np
+
+from scripts.schedule_engine import get_curve, get_periods, schedule_kernels
+
+percentiles = (5, 50, 95)
+
+
+def simulate_deviation(paths, months, phi=0.95, sigma=0.3, seed=None):
+    # (paths, months) deviations of annual inflation, in percent, from its
+    # mean. The AR(1) recursion runs over months, vectorized over paths.
+    rng = np.random.default_rng(seed)
+    deviation = rng.standard_normal((paths, months))
+    deviation *= sigma
+    for month in range(1, months):
+        deviation[:, month] += phi * deviation[:, month - 1]
+    return deviation
+
+
+def price_track_paths(params, deviation):
+    """Price one track, given as (schedule, cpi, madad, amount, interest,
+    period), against every path. Returns the (paths, months) arrays of
+    the kernel plus the per-path total nominal interest; unlinked tracks
+    come back with a single row that broadcasts."""
+    schedule, cpi, madad, amount, interest, period = params
+    periods = get_periods(period)
+    months = len(periods)
+    madad = get_curve(madad, months)
+    if np.ndim(madad):
+        madad = np.append(madad, madad[-1])  # flat after the curve ends
+    if len(cpi):
+        inflation = (madad + deviation[:, :months + 1]) * len(cpi)
+        growth = np.cumprod(1 + inflation / 1200, axis=1)
+    else:
+        growth = np.ones((1, months + 1))
+    kernel = schedule_kernels.get(schedule, schedule_kernels["bullet"])
+    arrays, total_ipmt_nominal = kernel(
+        amount, get_curve(interest, months) / 1200, growth[:, :months],
+        growth[:, 1:], periods, months)
+    arrays["pmt"] = arrays["ppmt"] + arrays["ipmt"]
+    return arrays, total_ipmt_nominal
+
+
+def simulate_mix(tracks, paths=1000, phi=0.95, sigma=0.3, seed=None):
+    """P5/P50/P95 bands of the mix's monthly payment and balance, and of
+    its total CPI cost, over `paths` simulated CPI paths.
+
+    `tracks` are (schedule, cpi, madad, amount, interest, period) tuples.
+    Returns {"months", "pmt", "balance", "total_cpi", "percentiles"} with
+    the monthly bands shaped (3, months).
+    """
+    if not tracks:
+        raise ValueError("no tracks to simulate")
+    months = max(len(get_periods(track[5])) for track in tracks)
+    deviation = simulate_deviation(paths, months + 1, phi, sigma, seed)
+
+    pmt = np.zeros((paths, months))
+    balance = np.zeros((paths, months))
+    total_ipmt_nominal = np.zeros(paths)
+    amount = 0
+    for track in tracks:
+        arrays, track_ipmt = price_track_paths(track, deviation)
+        period = arrays["pmt"].shape[1]
+        pmt[:, :period] += arrays["pmt"]
+        balance[:, :period] += arrays["balance"]
+        total_ipmt_nominal += track_ipmt
+        amount += track[3]
+
+    total_cpi = pmt.sum(axis=1) - amount - total_ipmt_nominal
+    return {
+        "months": np.arange(1, months + 1),
+        "percentiles": np.array(percentiles),
+        "pmt": np.percentile(pmt, percentiles, axis=0),
+        "balance": np.percentile(balance, percentiles, axis=0),
+        "total_cpi": np.percentile(total_cpi, percentiles),
+    }
@@ -0,0 +1,201 @@
+"""Search track allocations for the cheapest mix under a payment cap.
+
+Every schedule is linear in its amount, so each (offer, period) pair is
+priced once, for one shekel, with the batch engine. A candidate mix is a
+split of the loan between the offers (on a `step` grid) together with a
+period per offer. Its monthly payments are then a matrix product of the
+shares with the unit schedules of its periods. Candidates are evaluated
+one period combination at a time, across a process pool, and the
+cheapest feasible mixes by total payment (principal + interest + CPI,
+as in the summary table) are returned.
+
+    optimize_mix(1000000, [
+        {"schedule": "straight", "linked": True, "madad": 1.5, "interest": 3},
+        {"schedule": "prime", "linked": False, "interest": -0.5},
+    ], periods=(240, 300, 360), max_first_pmt=5000)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+
+import numpy as np
+
+from scripts.annuity_table import max_period
+from scripts.schedule_engine import get_batch_arrays
+
+default_periods = (120, 180, 240, 300, 360)
+progress_pieces = 20
+
+# Bounds of a search run as a job: six offers of five periods on a 10%
+# grid take about ten seconds, and every offer more multiplies that by 8.
+max_offers = 6
+max_offer_periods = 5
+min_step = 0.1
+
+
+def check_search(
+        total, offers, periods=default_periods, step=0.1, **options):
+    """Raise ValueError unless the search is within the job bounds."""
+    if not isinstance(offers, list) or not 1 <= len(offers) <= max_offers:
+        raise ValueError(f"a search takes 1 to {max_offers} offers")
+    if not min_step <= step <= 1:
+        raise ValueError(f"step must be between {min_step} and 1")
+    for offer in offers:
+        offer_periods = offer.get("periods", periods)
+        if not 1 <= len(offer_periods) <= max_offer_periods:
+            raise ValueError(
+                f"an offer takes 1 to {max_offer_periods} periods")
+        if not all(isinstance(period, int) and 1 <= period <= max_period
+                   for period in offer_periods):
+            raise ValueError(f"periods must be 1 to {max_period} months")
+
+
+def share_grid(offers, step):
+    # Every split of the loan into len(offers) multiples of `step`
+    # (stars and bars), within each offer's max_share.
+    units = int(round(1 / step))
+    bars = len(offers) - 1
+    splits = []
+    for cuts in itertools.combinations(range(units + bars), bars):
+        edges = (-1,) + cuts + (units + bars,)
+        splits.append([b - a - 1 for a, b in zip(edges, edges[1:])])
+    shares = np.array(splits, dtype=float).reshape(-1, len(offers)) / units
+    max_share = np.array([offer.get("max_share", 1) for offer in offers])
+    return shares[(shares <= max_share + 1e-9).all(axis=1)]
+
+
+def price_units(offers, offer_periods):
+    # One shekel of every offer over every one of its periods.
+    rows = [
+        (offer["schedule"], int(offer.get("linked", True)),
+         offer.get("madad", 0), 1.0, offer["interest"], period)
+        for offer, periods in zip(offers, offer_periods)
+        for period in periods]
+    arrays, total_ipmt_nominal = get_batch_arrays(*zip(*rows))
+    pmt = arrays["pmt"]
+    return {
+        "pmt": pmt,
+        "first_pmt": pmt[:, 0],
+        "total_pmt": pmt.sum(axis=1),
+        "total_ipmt": total_ipmt_nominal,
+    }
+
+
+def evaluate(state, combos):
+    """The `top` cheapest feasible candidates among the period
+    combinations `combos` (rows of unit row indices, one per offer)."""
+    shares, units, total = state["shares"], state["units"], state["total"]
+    zero_shares = shares == 0
+    found = []
+    for combo, unit_rows in combos:
+        # Periods of offers that get no share don't matter; keep only the
+        # first period for them so each mix is seen once.
+        unique = ~(zero_shares & (combo != 0)).any(axis=1)
+        pmt = shares[unique] @ units["pmt"][unit_rows] * total
+        first_pmt = pmt[:, 0]
+        max_pmt = pmt.max(axis=1)
+        feasible = np.ones(len(pmt), dtype=bool)
+        if state["max_first_pmt"] is not None:
+            feasible &= first_pmt <= state["max_first_pmt"]
+        if state["max_peak_pmt"] is not None:
+            feasible &= max_pmt <= state["max_peak_pmt"]
+        if not feasible.any():
+            continue
+        share_rows = np.flatnonzero(unique)[feasible]
+        first_pmt, max_pmt = first_pmt[feasible], max_pmt[feasible]
+        cost = shares[share_rows] @ units["total_pmt"][unit_rows] * total
+        best = np.argsort(cost, kind="stable")[:state["top"]]
+        for index in best:
+            found.append((
+                cost[index], tuple(combo), share_rows[index],
+                first_pmt[index], max_pmt[index]))
+    found.sort(key=lambda candidate: candidate[0])
+    return found[:state["top"]]
+
+
+worker_state = None
+
+
+def init_worker(state):
+    global worker_state
+    worker_state = state
+
+
+def evaluate_in_worker(combos):
+    return evaluate(worker_state, combos)
+
+
+def collect(results, count, top, progress=None):
+    # The `top` candidates of all chunk results, reporting each chunk.
+    found = []
+    for done, chunk in enumerate(results, start=1):
+        found.extend(chunk)
+        if progress:
+            progress(done / count)
+    found.sort(key=lambda candidate: candidate[0])
+    return found[:top]
+
+
+def optimize_mix(
+        total, offers, periods=default_periods, step=0.1,
+        max_first_pmt=None, max_peak_pmt=None, top=10, workers=None,
+        progress=None):
+    """The `top` cheapest mixes of `offers` for a loan of `total`.
+
+    Each offer is a dict with schedule, linked, madad and interest (as a
+    dashboard track, without amount and period) and optionally its own
+    "periods" to choose from and a "max_share" of the loan. Returns a list
+    of {"tracks": [...], "total_pmt", "first_pmt", "max_pmt",
+    "total_ipmt", "total_cpi"}, cheapest first. `progress` is called with
+    the fraction of candidates evaluated so far.
+    """
+    offer_periods = [offer.get("periods", periods) for offer in offers]
+    units = price_units(offers, offer_periods)
+    offsets = np.cumsum([0] + [len(p) for p in offer_periods])[:-1]
+    combos = [
+        (np.array(combo), offsets + np.array(combo))
+        for combo in itertools.product(*(range(len(p)) for p in offer_periods))]
+    state = {
+        "shares": share_grid(offers, step),
+        "units": units,
+        "total": total,
+        "max_first_pmt": max_first_pmt,
+        "max_peak_pmt": max_peak_pmt,
+        "top": top,
+    }
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(combos) < 2 * workers:
+        # In one piece, unless someone is waiting on the progress.
+        pieces = progress_pieces if progress else 1
+        chunks = [combos[i::pieces] for i in range(pieces)]
+        results = (evaluate(state, chunk) for chunk in chunks)
+        found = collect(results, len(chunks), top, progress)
+    else:
+        chunks = [combos[i::workers * 4] for i in range(workers * 4)]
+        with ProcessPoolExecutor(
+                workers, initializer=init_worker, initargs=(state,)) as pool:
+            results = pool.map(evaluate_in_worker, chunks)
+            found = collect(results, len(chunks), top, progress)
+
+    mixes = []
+    for cost, combo, share_row, first_pmt, max_pmt in found:
+        tracks = []
+        total_ipmt = 0
+        for offer, share in enumerate(state["shares"][share_row]):
+            if share == 0:
+                continue
+            unit_row = offsets[offer] + combo[offer]
+            total_ipmt += share * total * units["total_ipmt"][unit_row]
+            tracks.append(dict(
+                offers[offer], amount=share * total,
+                period=offer_periods[offer][combo[offer]], offer=offer))
+        mixes.append({
+            "tracks": tracks,
+            "total_pmt": cost,
+            "first_pmt": first_pmt,
+            "max_pmt": max_pmt,
+            "total_ipmt": total_ipmt,
+            "total_cpi": cost - total - total_ipmt,
+        })
+    return mixes
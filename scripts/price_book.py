@@ -0,0 +1,193 @@
+"""Price a book of loan tracks from CSV/Parquet into per-loan summaries.
+
+    python -m scripts.price_book book.csv summaries.csv --workers 4
+
+The input needs the columns schedule, linked, madad, amount, interest and
+period (any `id` column is copied through); linked is a number or
+true/false/yes/no in any case. It is read in chunks which a process pool
+prices with the batch engine, and summaries are appended to the output as
+chunks finish, in input order, so memory stays bounded by the chunks in
+flight. Rows that can't be priced (a blank or fractional
+period, a period past 420 months, a non-numeric amount...) get empty
+summaries and are reported by row number on stderr.
+
+Parquet in or out needs pyarrow, which is optional and not in
+requirements.txt.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from scripts.annuity_table import max_period
+from scripts.schedule_engine import iter_batch_arrays
+
+track_columns = ("schedule", "linked", "madad", "amount", "interest", "period")
+numeric_columns = track_columns[1:]
+# Spellings of a linked flag besides numbers, case-insensitive.
+linked_words = {"true": 1, "false": 0, "yes": 1, "no": 0}
+reported_rows = 10  # row numbers listed per chunk
+summary_columns = (
+    "first_pmt", "max_pmt", "total_pmt", "total_ipmt", "total_cpi",
+    "pmt_per_shekel")
+
+
+def summarize_batch(chunk):
+    """Per-loan summary columns (as in the dashboard's summary table) for a
+    dict of track column arrays."""
+    columns = [np.asarray(chunk[name]) for name in track_columns]
+    summaries = {name: [] for name in summary_columns}
+    for _, arrays, total_ipmt_nominal in iter_batch_arrays(
+            *columns, chunk_size=2000):
+        pmt = arrays["pmt"]
+        summaries["first_pmt"].append(pmt[:, 0])
+        summaries["max_pmt"].append(pmt.max(axis=1))
+        summaries["total_pmt"].append(pmt.sum(axis=1))
+        summaries["total_ipmt"].append(total_ipmt_nominal)
+    summaries = {
+        name: np.concatenate(values) if values else np.zeros(0)
+        for name, values in summaries.items()}
+
+    amount = np.asarray(chunk["amount"], dtype=float)
+    total_cpi = summaries["total_pmt"] - amount - summaries["total_ipmt"]
+    summaries["total_cpi"] = np.where(total_cpi <= 2, 0, total_cpi)
+    summaries["pmt_per_shekel"] = summaries["total_pmt"] / amount
+    return summaries
+
+
+def clean_columns(chunk):
+    """The track columns of a chunk as the batch engine takes them, for
+    the rows it can price, and the mask of those rows."""
+    columns = {}
+    valid = np.ones(len(chunk), dtype=bool)
+    for name in numeric_columns:
+        values = chunk[name]
+        if name == "linked" and values.dtype == object:
+            words = values.astype(str).str.strip().str.lower().map(
+                linked_words)
+            values = words.where(words.notna(), values)
+        values = pd.to_numeric(values, errors="coerce").to_numpy(
+            dtype=float)
+        valid &= np.isfinite(values)
+        columns[name] = values
+    period = columns["period"]
+    with np.errstate(invalid="ignore"):
+        valid &= (period == np.round(period)) & (1 <= period) & (
+            period <= max_period)
+    columns = {name: values[valid] for name, values in columns.items()}
+    columns["period"] = columns["period"].astype(int)
+    columns["schedule"] = chunk["schedule"].to_numpy()[valid]
+    return columns, valid
+
+
+def read_chunks(path, chunksize):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class Writer:
+    def __init__(self, path):
+        self.path = path
+        self.parquet = None
+        self.header = True
+
+    def write(self, df):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table)
+        else:
+            df.to_csv(
+                self.path, mode="w" if self.header else "a",
+                header=self.header, index=False)
+            self.header = False
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def summary_frame(chunk, summaries, valid):
+    # Rows that weren't priced stay NaN.
+    full = {}
+    for name, values in summaries.items():
+        full[name] = np.full(len(valid), np.nan)
+        full[name][valid] = values
+    df = pd.DataFrame(full, columns=summary_columns)
+    if "id" in chunk:
+        df.insert(0, "id", chunk["id"].to_numpy())
+    return df
+
+
+def report_rows(source, rows):
+    listed = ", ".join(str(row) for row in rows[:reported_rows])
+    more = f" and {len(rows) - reported_rows:,} more" if (
+        len(rows) > reported_rows) else ""
+    print(f"{source}: {len(rows):,} rows can't be priced and are left"
+          f" empty: rows {listed}{more}", file=sys.stderr)
+
+
+def price_book(source, target, chunksize=50000, workers=None):
+    workers = workers or os.cpu_count()
+    writer = Writer(target)
+    pending = []
+    loans = 0
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            for chunk in read_chunks(source, chunksize):
+                missing = set(track_columns) - set(chunk.columns)
+                if missing:
+                    raise ValueError(f"{source} is missing {sorted(missing)}")
+                columns, valid = clean_columns(chunk)
+                if not valid.all():
+                    report_rows(source, loans + np.flatnonzero(~valid) + 1)
+                ids = chunk[["id"]] if "id" in chunk else chunk.iloc[:, :0]
+                pending.append(
+                    (ids, valid, pool.submit(summarize_batch, columns)))
+                # Keep at most two chunks per worker in memory.
+                while len(pending) >= 2 * workers:
+                    ids, valid, future = pending.pop(0)
+                    writer.write(summary_frame(ids, future.result(), valid))
+                loans += len(chunk)
+            for ids, valid, future in pending:
+                writer.write(summary_frame(ids, future.result(), valid))
+    finally:
+        writer.close()
+    return loans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Price loan tracks into per-loan summaries.",
+        epilog="pyarrow is optional and not in requirements.txt; install "
+               "it to read or write .parquet.")
+    parser.add_argument(
+        "source", help="input .csv or .parquet (parquet needs pyarrow)")
+    parser.add_argument(
+        "target", help="output .csv or .parquet (parquet needs pyarrow)")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    parquet = any(
+        path.endswith(".parquet") for path in (args.source, args.target))
+    if parquet and importlib.util.find_spec("pyarrow") is None:
+        parser.error("parquet needs pyarrow: pip install pyarrow")
+    loans = price_book(args.source, args.target, args.chunksize, args.workers)
+    print(f"priced {loans:,} loans into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import operator
+import threading
+
+import numpy as np
+
+from scripts.metrics import cache_events, schedule_seconds
+from scripts.schedule_engine import Schedule, build_schedule, schedule_arrays
+from scripts.shared_cache import SharedCache
+
+
+def curve_key(values):
+    # Per-month curves become tuples so they can be hashed.
+    if np.ndim(values) == 0:
+        return float(values)
+    return tuple(np.asarray(values, dtype=float).tolist())
+
+
+def track_key(schedule, cpi, madad, amount, interest, period):
+    # Tracks that price the same share a key: an unlinked track ignores
+    # madad, and unknown schedules are bullets.
+    if schedule not in schedule_arrays:
+        schedule = "bullet"
+    if np.ndim(madad):
+        madad = np.asarray(madad, dtype=float)
+    return (
+        schedule, curve_key(madad * len(cpi)), float(amount),
+        curve_key(interest), operator.index(period))
+
+
+class ScheduleCache:
+    """Bounded, thread-safe LRU cache of computed track schedules.
+
+    Values are read-only Schedule objects, shared by every caller; a
+    float32 cache holds twice the schedules in the same memory. With a
+    `shared` SharedCache, local misses are looked up there before being
+    computed, and computed schedules are stored there for other workers.
+    """
+
+    def __init__(self, maxsize=256, dtype=np.float64, shared=None):
+        self.maxsize = maxsize
+        self.dtype = dtype
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schedule, cpi, madad, amount, interest, period):
+        key = track_key(schedule, cpi, madad, amount, interest, period)
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                cache_events.labels("hit").inc()
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            cache_events.labels("miss").inc()
+
+        # Computed outside the lock so a slow track never blocks hits.
+        value = self._get_shared(key)
+        if value is None:
+            with schedule_seconds.labels(key[0]).time():
+                value = build_schedule(
+                    schedule, cpi, madad, amount, interest, period,
+                    self.dtype)
+            if self.shared is not None:
+                self.shared.set([key, np.dtype(self.dtype).str], value.dumps())
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                cache_events.labels("eviction").inc()
+        return value
+
+    def _get_shared(self, key):
+        if self.shared is None:
+            return None
+        data = self.shared.get([key, np.dtype(self.dtype).str])
+        if data is None:
+            return None
+        cache_events.labels("shared_hit").inc()
+        return Schedule.loads(data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "nbytes": sum(value.nbytes for value in self._data.values()),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+schedule_cache = ScheduleCache(shared=SharedCache.from_env())
@@ -0,0 +1,451 @@
+import json
+import operator
+
+import numpy as np
+import pandas as pd
+
+months_heb = "חודש"
+pmt_heb = "החזר חודשי"
+ppmt_heb = "תשלום קרן"
+ipmt_heb = "תשלום ריבית"
+cumulative_heb = "תשלום מצטבר"
+balance_heb = "יתרה"
+
+# Array name -> DataFrame column, in the order the tables show them.
+columns_heb = {
+    "months": months_heb,
+    "ppmt": ppmt_heb,
+    "ipmt": ipmt_heb,
+    "pmt": pmt_heb,
+    "cumulative": cumulative_heb,
+    "balance": balance_heb,
+}
+
+
+# Prime tracks are quoted as a spread over the prime rate (the Bank of
+# Israel rate plus 1.5%): their interest is the spread, and the rate they
+# pay is this path plus it. The path is annual percent per month from now,
+# flat after its last month.
+prime_path = (6.0,)
+
+
+def prime_rates(spread, months, start=0):
+    # Annual rates of a prime track's months start + 1..start + months:
+    # the prime path plus the spread, one number or a curve.
+    path = np.asarray(prime_path, dtype=float)
+    if len(path) == 1:
+        return path[0] + spread
+    months = np.minimum(np.arange(start, start + months), len(path) - 1)
+    return path[months] + spread
+
+
+def get_curve(values, period):
+    # A per-month curve (one value per month) as an array; scalars pass
+    # through untouched so they broadcast.
+    if np.ndim(values) == 0:
+        return values
+    values = np.asarray(values, dtype=float)
+    if values.shape != (period,):
+        raise ValueError(
+            f"expected one value per month ({period}), got {values.shape}")
+    return values
+
+
+def get_minf(cpi, madad):
+    inflation = madad * len(cpi)  # 1.48953% due to Bank Leumi
+    return 1 + inflation / 1200
+
+
+def get_periods(period):
+    # Same contract as range(1, period + 1): ints only, at least one month.
+    period = operator.index(period)
+    if period < 1:
+        raise ValueError(f"period must be at least 1 month, got {period}")
+    return np.arange(1, period + 1, dtype=float)
+
+
+def get_growth(minf, months):
+    # CPI growth factors up to and including every month n, and of month
+    # n + 1, as cumulative products of the monthly factors. A scalar minf
+    # (or a (loans, 1) column) is broadcast over the months; a curve is
+    # taken as flat after its last month.
+    minf = np.asarray(minf, dtype=float)
+    if minf.ndim and minf.shape[-1] > 1:
+        factors = np.concatenate((minf, minf[..., -1:]), axis=-1)
+    else:
+        factors = np.broadcast_to(minf, minf.shape[:-1] + (months + 1,))
+    growth = np.cumprod(factors, axis=-1)
+    return growth[..., :-1], growth[..., 1:]
+
+
+def get_balance(amount, ppmt_nominal, next_growth):
+    # Closed form of balance[n] = (balance[n - 1] - ppmt_nominal[n] * growth[n])
+    # * (growth[n + 1] / growth[n]) with balance[0] = amount * growth[1].
+    return next_growth * (amount - np.cumsum(ppmt_nominal, axis=-1))
+
+
+def is_curve(values):
+    return np.ndim(values) > 0 and np.shape(values)[-1] > 1
+
+
+def annuity_nominal(amount, interest_rate, periods, period):
+    interest_rate = np.asarray(interest_rate, dtype=float)
+    if is_curve(interest_rate):
+        return reamortized_nominal(amount, interest_rate, periods, period)
+
+    # Same closed forms as npf.ipmt / npf.ppmt with pv=-amount, when='end'.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temp = (1 + interest_rate) ** period
+        pmt = np.where(
+            interest_rate == 0, amount / period,
+            amount * temp * interest_rate / (temp - 1))
+        growth = (1 + interest_rate) ** (periods - 1)
+        ipmt = np.where(
+            interest_rate == 0, 0.,
+            amount * growth * interest_rate - pmt * (growth - 1))
+    return ipmt, pmt - ipmt
+
+
+def reamortized_nominal(amount, interest_rate, periods, period):
+    # With a rate per month the payment is re-amortized every month over
+    # the months left: pmt[n] = balance[n - 1] * annuity(rate[n], left[n]),
+    # so balance[n] = balance[n - 1] * (1 + rate[n] - annuity[n]) is a
+    # cumulative product. With a flat curve this is the plain annuity.
+    left = period - periods + 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(
+            interest_rate == 0, 1 / left,
+            interest_rate / (1 - (1 + interest_rate) ** -left))
+    remaining = np.cumprod(1 + interest_rate - annuity, axis=-1)
+    prev_balance = amount * np.concatenate(
+        (np.ones(remaining.shape[:-1] + (1,)), remaining[..., :-1]), axis=-1)
+    ipmt = prev_balance * interest_rate
+    return ipmt, prev_balance * annuity - ipmt
+
+
+# Schedule kernels. `growth` is the CPI growth factor of every month up to
+# and including it and `next_growth` that of the month after; for a scalar
+# madad they are minf ** n and minf ** (n + 1). `interest_rate` is monthly,
+# a scalar or a (months,) curve. Scalars with a (months,)
+# `periods` price one track; (loans, 1) columns with a (loans, months)
+# `mask` price a whole batch; (paths, months) growths price one track
+# under many CPI paths.
+def straight_kernel(
+        amount, interest_rate, growth, next_growth, periods, period,
+        mask=True):
+    ipmt_nominal, ppmt_nominal = annuity_nominal(
+        amount, interest_rate, periods, period)
+    arrays = {
+        "ppmt": ppmt_nominal * growth,
+        "ipmt": ipmt_nominal * growth,
+        "balance": get_balance(amount, ppmt_nominal, next_growth),
+    }
+    return arrays, np.sum(ipmt_nominal * mask, axis=-1)
+
+
+def declining_kernel(
+        amount, interest_rate, growth, next_growth, periods, period,
+        mask=True):
+    ppmt_nominal = np.broadcast_to(amount / period, growth.shape)
+    paid = np.cumsum(ppmt_nominal, axis=-1)
+
+    # Interest is charged on the previous month's indexed balance. The
+    # nominal total keeps the first month unindexed, as it always has.
+    prev_balance = growth * (amount - paid + ppmt_nominal)
+    ipmt_nominal = np.where(periods == 1, amount, prev_balance) * interest_rate
+    arrays = {
+        "ppmt": ppmt_nominal * growth,
+        "ipmt": prev_balance * interest_rate,
+        "balance": next_growth * (amount - paid),
+    }
+    return arrays, np.sum(ipmt_nominal * mask, axis=-1)
+
+
+def bullet_kernel(
+        amount, interest_rate, growth, next_growth, periods, period,
+        mask=True):
+    ipmt_nominal = amount * interest_rate
+
+    # The whole indexed principal is repaid in the last month.
+    last = periods == period
+    indexed_amount = amount * growth
+    arrays = {
+        "ppmt": np.where(last, indexed_amount, 0.),
+        "ipmt": ipmt_nominal * growth,
+        "balance": np.where(last, 0., indexed_amount),
+    }
+    if is_curve(interest_rate):
+        return arrays, np.sum(ipmt_nominal * mask, axis=-1)
+    # A float for one track, as the other kernels' sums are; a (loans,)
+    # array for a batch, even of one loan.
+    total_ipmt_nominal = ipmt_nominal * period
+    if np.ndim(total_ipmt_nominal) == 0:
+        return arrays, float(total_ipmt_nominal)
+    return arrays, total_ipmt_nominal.reshape(-1)
+
+
+def reset_rates(interest_rate, reset, periods):
+    # The rate of every month is the curve's rate at the last reset point,
+    # i.e. the curve stepped into segments of `reset` months.
+    if not is_curve(interest_rate):
+        return interest_rate
+    segment_starts = (periods.astype(int) - 1) // reset * reset
+    return interest_rate[..., segment_starts]
+
+
+def variable_kernel(
+        amount, interest_rate, growth, next_growth, periods, period,
+        mask=True, reset=60):
+    # Variable rate Spitzer: at every reset point the remaining balance is
+    # re-amortized over the months left at the rate path's current value.
+    # Between resets the rate is flat, so the straight kernel's monthly
+    # re-amortization keeps the payment of the segment.
+    return straight_kernel(
+        amount, reset_rates(interest_rate, reset, periods), growth,
+        next_growth, periods, period, mask)
+
+
+def prime_kernel(
+        amount, interest_rate, growth, next_growth, periods, period,
+        mask=True):
+    # `interest_rate` is the monthly spread. The prime path can move any
+    # month, so the payment is re-amortized every month, which the
+    # straight kernel does for a rate curve.
+    rates = interest_rate + prime_rates(0, periods.shape[-1]) / 1200
+    return straight_kernel(
+        amount, rates, growth, next_growth, periods, period, mask)
+
+
+schedule_kernels = {
+    "straight": straight_kernel,
+    "declining": declining_kernel,
+    "bullet": bullet_kernel,
+    "variable": variable_kernel,
+    "prime": prime_kernel,
+}
+
+
+def finish_arrays(months, arrays, cumulative=True):
+    pmt = arrays["ppmt"] + arrays["ipmt"]
+    finished = {
+        "months": months,
+        "ppmt": arrays["ppmt"],
+        "ipmt": arrays["ipmt"],
+        "pmt": pmt,
+        "cumulative": np.cumsum(pmt, axis=-1),
+        "balance": arrays["balance"],
+    }
+    if not cumulative:
+        del finished["cumulative"]
+    return finished
+
+
+def get_arrays(kernel, cpi, madad, amount, interest, period, cumulative=True):
+    # madad and interest are annual percentages, either one number or a
+    # curve with a value per month.
+    periods = get_periods(period)
+    months = len(periods)
+    minf = get_minf(cpi, get_curve(madad, months))
+    growth, next_growth = get_growth(minf, months)
+    arrays, total_ipmt_nominal = kernel(
+        amount, get_curve(interest, months) / 1200, growth, next_growth,
+        periods, months)
+    return (
+        finish_arrays(periods.astype(int), arrays, cumulative),
+        total_ipmt_nominal)
+
+
+def straight_arrays(cpi, madad, amount, interest, period):
+    return get_arrays(straight_kernel, cpi, madad, amount, interest, period)
+
+
+def declining_arrays(cpi, madad, amount, interest, period):
+    return get_arrays(declining_kernel, cpi, madad, amount, interest, period)
+
+
+def bullet_arrays(cpi, madad, amount, interest, period):
+    # Bullet tables have never shown a cumulative column.
+    return get_arrays(
+        bullet_kernel, cpi, madad, amount, interest, period, cumulative=False)
+
+
+def variable_arrays(cpi, madad, amount, interest, period):
+    # `interest` is the rate path, one rate per month; a single rate is a
+    # flat path and prices as straight.
+    return get_arrays(variable_kernel, cpi, madad, amount, interest, period)
+
+
+def prime_arrays(cpi, madad, amount, interest, period):
+    return get_arrays(prime_kernel, cpi, madad, amount, interest, period)
+
+
+schedule_arrays = {
+    "straight": straight_arrays,
+    "declining": declining_arrays,
+    "bullet": bullet_arrays,
+    "variable": variable_arrays,
+    "prime": prime_arrays,
+}
+
+
+def get_schedule_arrays(schedule, cpi, madad, amount, interest, period):
+    # Anything that is not a known schedule falls back to bullet.
+    arrays = schedule_arrays.get(schedule, bullet_arrays)
+    return arrays(cpi, madad, amount, interest, period)
+
+
+def to_frame(arrays):
+    return pd.DataFrame(
+        {columns_heb[name]: values for name, values in arrays.items()})
+
+
+def generate_schedule(schedule, cpi, madad, amount, interest, period):
+    arrays, total_ipmt_nominal = get_schedule_arrays(
+        schedule, cpi, madad, amount, interest, period)
+    return to_frame(arrays), total_ipmt_nominal
+
+
+class Schedule:
+    """One track's schedule in a single read-only (columns, months) block.
+
+    Reads like the arrays dict it is built from: schedule["pmt"],
+    `"cumulative" in schedule` and items() give views of the block, with
+    months made on the fly rather than stored. The totals the summary
+    needs are computed once, and a DataFrame only by to_frame().
+    """
+
+    __slots__ = (
+        "names", "values", "total_ipmt_nominal", "first_pmt", "max_pmt",
+        "total_pmt")
+
+    def __init__(self, arrays, total_ipmt_nominal, dtype=np.float64):
+        self.names = tuple(name for name in columns_heb if name in arrays)
+        self.values = np.array(
+            [arrays[name] for name in self.names[1:]], dtype=dtype)
+        self.values.setflags(write=False)
+        self.total_ipmt_nominal = float(total_ipmt_nominal)
+        pmt = arrays["pmt"]
+        self.first_pmt = float(pmt[0])
+        self.max_pmt = float(pmt.max())
+        self.total_pmt = float(pmt.sum())
+
+    @property
+    def period(self):
+        return self.values.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def __getitem__(self, name):
+        if name == "months":
+            return np.arange(1, self.period + 1)
+        if name not in self.names:
+            raise KeyError(name)
+        return self.values[self.names.index(name) - 1]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return self.names
+
+    def items(self):
+        return ((name, self[name]) for name in self.names)
+
+    def to_frame(self):
+        return to_frame(self)
+
+    def dumps(self):
+        # A JSON header line then the raw block, for caches shared between
+        # processes; np.load's headers take longer to parse than the
+        # schedule takes to compute.
+        header = {
+            "names": self.names,
+            "dtype": self.values.dtype.str,
+            "shape": self.values.shape,
+            "totals": [
+                self.total_ipmt_nominal, self.first_pmt, self.max_pmt,
+                self.total_pmt],
+        }
+        return json.dumps(header).encode() + b"\n" + self.values.tobytes()
+
+    @classmethod
+    def loads(cls, data):
+        header, _, block = data.partition(b"\n")
+        header = json.loads(header)
+        schedule = cls.__new__(cls)
+        schedule.names = tuple(header["names"])
+        # A view of the immutable bytes, so already read-only.
+        schedule.values = np.frombuffer(
+            block, dtype=header["dtype"]).reshape(header["shape"])
+        (schedule.total_ipmt_nominal, schedule.first_pmt, schedule.max_pmt,
+         schedule.total_pmt) = header["totals"]
+        return schedule
+
+
+def build_schedule(
+        schedule, cpi, madad, amount, interest, period, dtype=np.float64):
+    return Schedule(*get_schedule_arrays(
+        schedule, cpi, madad, amount, interest, period), dtype=dtype)
+
+
+def get_batch_arrays(schedules, linked, madad, amount, interest, period):
+    """Price many tracks at once as (loans, months) matrices.
+
+    Every argument is a 1-D sequence with one entry per loan; `linked`
+    plays the role of len(cpi). Rows are padded with zeros after each
+    loan's last month, up to the longest period in the batch. Unlike the
+    single track tables, bullet rows get a cumulative column as well.
+    """
+    schedules = np.asarray(schedules)
+    column = lambda values: np.asarray(values, dtype=float).reshape(-1, 1)
+    minf = 1 + column(madad) * column(linked) / 1200
+    amount, interest_rate = column(amount), column(interest) / 1200
+    period = np.asarray(period).reshape(-1, 1)
+    # An empty list comes out float, and an empty chunk is a valid batch.
+    if period.size and period.dtype.kind not in "iu":
+        raise TypeError("period must be an integer array")
+    if period.size and period.min() < 1:
+        raise ValueError("period must be at least 1 month")
+
+    periods = np.arange(1, period.max(initial=0) + 1, dtype=float)
+    mask = periods <= period
+    shape = mask.shape
+    arrays = {name: np.zeros(shape) for name in ("ppmt", "ipmt", "balance")}
+    total_ipmt_nominal = np.zeros(len(period))
+
+    # Anything that is not a known schedule falls back to bullet.
+    groups = {name: schedules == name for name in schedule_kernels}
+    groups["bullet"] = ~np.isin(schedules, list(schedule_kernels)) | (
+        schedules == "bullet")
+    for schedule, rows in groups.items():
+        if not rows.any():
+            continue
+        growth, next_growth = get_growth(minf[rows], len(periods))
+        group_arrays, total_ipmt_nominal[rows] = schedule_kernels[schedule](
+            amount[rows], interest_rate[rows], growth, next_growth,
+            periods, period[rows], mask[rows])
+        for name, values in group_arrays.items():
+            arrays[name][rows] = values * mask[rows]
+
+    arrays = finish_arrays(periods.astype(int), arrays)
+    arrays["cumulative"] *= mask
+    return arrays, total_ipmt_nominal
+
+
+def iter_batch_arrays(
+        schedules, linked, madad, amount, interest, period, chunk_size=10000):
+    # A million 420-month loans is several GB per matrix, so whole books
+    # are priced chunk by chunk. Yields (first row, arrays, totals).
+    for start in range(0, len(schedules), chunk_size):
+        rows = slice(start, start + chunk_size)
+        yield (start,) + get_batch_arrays(
+            schedules[rows], linked[rows], madad[rows], amount[rows],
+            interest[rows], period[rows])
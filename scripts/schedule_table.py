@@ -0,0 +1,32 @@
+import math
+
+import numpy as np
+
+from scripts.schedule_engine import columns_heb
+
+
+def table_columns(arrays):
+    # Balance first and month last, as the report has always read.
+    return [
+        {"name": columns_heb[name], "id": name}
+        for name in reversed(list(arrays))]
+
+
+def table_page(arrays, page_current, page_size, sort_by=None):
+    """One rounded page of the schedule as DataTable records, plus the
+    page count. Only the requested rows are converted, so the payload
+    stays the same size however long the schedule is."""
+    length = len(arrays["months"])
+    rows = np.arange(length)
+    if sort_by:
+        values = arrays[sort_by[0]["column_id"]]
+        rows = np.argsort(values, kind="stable")
+        if sort_by[0]["direction"] == "desc":
+            rows = rows[::-1]
+    rows = rows[page_current * page_size:(page_current + 1) * page_size]
+
+    columns = {
+        name: np.round(values[rows], 2).tolist()
+        for name, values in arrays.items()}
+    records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    return records, max(1, math.ceil(length / page_size))
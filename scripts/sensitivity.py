@@ -0,0 +1,47 @@
+"""How the mix's payments move with one track's rate and period.
+
+sensitivity() prices the chosen track at every point of a rate x period
+grid in a single get_batch_arrays call and adds each row to the monthly
+payments of the other tracks, so the mix's first payment, peak payment
+and total payments come out for the whole grid at once, instead of a
+callback round trip per edited value.
+"""
+import numpy as np
+
+from scripts.mix_aggregator import MixAggregator
+from scripts.schedule_engine import get_batch_arrays
+
+default_rates = np.round(np.arange(0, 10.01, 0.25), 2)
+default_periods = np.arange(60, 421, 12)
+
+
+def sensitivity(tracks, slot, rates=default_rates, periods=default_periods):
+    """{"first_pmt", "max_pmt", "total_pmt"}, each a (rates, periods)
+    matrix for the mix of `tracks` ((schedule, cpi, madad, amount,
+    interest, period) per slot) with track `slot` repriced at every
+    annual rate and period; plus the "rates" and "periods" themselves."""
+    schedule, cpi, madad, amount, _, _ = tracks[slot]
+    others = [None if other == slot else params
+              for other, params in enumerate(tracks)]
+    rest = MixAggregator().update(others)
+    rest_pmt = rest[0]["pmt"] if rest is not None else np.zeros(0)
+
+    rate_grid, period_grid = np.meshgrid(rates, periods, indexing="ij")
+    size = rate_grid.size
+    arrays, _ = get_batch_arrays(
+        np.full(size, schedule), np.full(size, len(cpi)),
+        np.full(size, madad), np.full(size, amount),
+        rate_grid.ravel(), period_grid.ravel())
+    pmt = arrays["pmt"]
+    if len(rest_pmt) > pmt.shape[1]:
+        pmt = np.pad(pmt, ((0, 0), (0, len(rest_pmt) - pmt.shape[1])))
+    pmt[:, :len(rest_pmt)] += rest_pmt
+
+    shape = rate_grid.shape
+    return {
+        "rates": np.asarray(rates),
+        "periods": np.asarray(periods),
+        "first_pmt": pmt[:, 0].reshape(shape),
+        "max_pmt": pmt.max(axis=1).reshape(shape),
+        "total_pmt": pmt.sum(axis=1).reshape(shape),
+    }
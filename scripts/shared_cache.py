@@ -0,0 +1,117 @@
+"""A size-bounded disk cache shared by every worker process on a host.
+
+Entries are files named by a canonical hash of their key, so any process
+computing the same track finds the others' result. Writes go to a
+temporary file and are renamed into place, which is atomic, so readers
+never see half an entry and no lock is needed between processes. Reads
+touch the file's mtime; when the directory grows past `max_bytes` the
+least recently used files are deleted down to `low_water` of it.
+
+The directory is $SCHEDULE_CACHE_DIR (see gunicorn.conf.py, which gives
+every deployment a fresh one); without it there is no shared cache.
+"""
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Bump when the engine's results change, so old entries never match.
+cache_version = 2
+
+
+@contextmanager
+def atomic_file(path, mode="wb"):
+    """A temporary file next to `path`, renamed onto it once written, so a
+    reader in another process sees the old file or the whole new one."""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def canonical_hash(key):
+    text = json.dumps([cache_version, key], separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SharedCache:
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20, low_water=0.8):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        os.makedirs(directory, exist_ok=True)
+        # Sizes are only summed up again after a tenth of max_bytes has
+        # been written by this process.
+        self._written = max_bytes
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("SCHEDULE_CACHE_DIR")
+        if not directory:
+            return None
+        max_bytes = int(os.environ.get(
+            "SCHEDULE_CACHE_BYTES", 256 * 2 ** 20))
+        return cls(directory, max_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.directory, canonical_hash(key))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:  # never written, or just evicted
+            return None
+        return data
+
+    def set(self, key, data):
+        with atomic_file(self._path(key)) as f:
+            f.write(data)
+        with self._lock:
+            self._written += len(data)
+            if self._written < self.max_bytes / 10:
+                return
+            self._written = 0
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * self.low_water:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # another worker got there first
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,127 @@
+"""What-if changes partway through a track: a lump-sum prepayment and/or a
+new interest rate, made with month k's payment.
+
+Months 1..k are the cached schedule of the track, reused as is; only the
+months after k are priced again. They are a new loan of the remaining
+nominal balance over the remaining months, with the CPI growth of the
+first k months carried over, so each scenario costs O(remaining months).
+A prepayment keeps the term and lowers the payments after it, and is
+added to month k's principal payment so the totals include it.
+"""
+import numpy as np
+
+from scripts.schedule_cache import schedule_cache
+from scripts.schedule_engine import (
+    bullet_kernel, declining_kernel, get_curve, get_growth, get_minf,
+    get_periods, prime_rates, reset_rates, schedule_kernels, straight_kernel)
+
+# Rate paths of these schedules only take effect at their reset months.
+reset_months = {"variable": 60, "prime": 1}
+
+
+def suffix_rates(schedule, interest, month, period):
+    # Monthly rates of months month + 1..period, `interest` being the
+    # annual rate of the whole track.
+    interest = get_curve(interest, period)
+    if schedule in reset_months and np.ndim(interest):
+        periods = np.arange(month + 1, period + 1)
+        return reset_rates(interest / 1200, reset_months[schedule], periods)
+    if np.ndim(interest):
+        return interest[month:] / 1200
+    return interest / 1200
+
+
+def what_if(
+        schedule, cpi, madad, amount, interest, period, month,
+        prepayment=0, new_interest=None):
+    """The schedule of a track after a change with month `month`'s
+    payment: `prepayment` shekels (in that month's indexed terms) off the
+    balance, and/or `new_interest` as the annual rate from the next month
+    on, one number or a curve over the remaining months. Returns
+    (arrays, total_ipmt_nominal) like the schedule engine.
+    """
+    arrays = schedule_cache.get(
+        schedule, cpi, madad, amount, interest, period)
+    total_ipmt_nominal = arrays.total_ipmt_nominal
+    months = len(get_periods(period))
+    if not 1 <= month < months:
+        raise ValueError(f"month must be between 1 and {months - 1}")
+    remaining = months - month
+    balance = arrays["balance"][month - 1]
+    if not 0 <= prepayment <= balance:
+        raise ValueError(f"prepayment must be between 0 and {balance:.2f}")
+
+    # Variable and prime tracks are straight tracks between resets.
+    kernel = schedule_kernels.get(schedule, bullet_kernel)
+    if schedule in reset_months:
+        kernel = straight_kernel
+    if schedule == "prime":
+        # Spreads over the prime path, old and new, become the rates.
+        interest = prime_rates(get_curve(interest, months), months)
+        if new_interest is not None:
+            new_interest = prime_rates(
+                get_curve(new_interest, remaining), remaining, month)
+
+    # CPI growth of the months after `month`, continuing from the growth
+    # reached at it. A curve extends flat after its end, as in get_growth.
+    minf = get_minf(cpi, get_curve(madad, months))
+    if np.ndim(minf):
+        reached = np.prod(minf[:month])
+        growth, next_growth = get_growth(minf[month:], remaining)
+    else:
+        reached = minf ** month
+        growth, next_growth = get_growth(minf, remaining)
+    growth, next_growth = reached * growth, reached * next_growth
+
+    # The balance column is indexed to the next month, but a bullet's to
+    # the month itself.
+    if kernel is bullet_kernel:
+        nominal_balance = balance / reached
+    else:
+        nominal_balance = balance / growth[0]
+    new_balance = nominal_balance
+    if prepayment:
+        new_balance = nominal_balance * (1 - prepayment / balance)
+
+    rates = suffix_rates(schedule, interest, month, months)
+    if new_interest is None:
+        new_rates = rates
+    elif schedule in reset_months:
+        # The changed path still only resets the rate at reset months.
+        path = np.concatenate((
+            np.broadcast_to(get_curve(interest, months), (months,))[:month],
+            np.broadcast_to(get_curve(new_interest, remaining), (remaining,))))
+        new_rates = suffix_rates(schedule, path, month, months)
+    else:
+        new_rates = get_curve(new_interest, remaining) / 1200
+
+    # The cache only keeps the nominal interest total, so the suffix's old
+    # share of it is priced again and swapped for the new one.
+    periods = get_periods(remaining)
+    old_suffix, old_suffix_ipmt = kernel(
+        nominal_balance, rates, growth, next_growth, periods, remaining)
+    suffix, new_suffix_ipmt = kernel(
+        new_balance, new_rates, growth, next_growth, periods, remaining)
+    if kernel is declining_kernel:
+        # Its total leaves only the track's first month unindexed, not the
+        # suffix's first month.
+        old_suffix_ipmt = old_suffix["ipmt"].sum()
+        new_suffix_ipmt = suffix["ipmt"].sum()
+    total_ipmt_nominal = total_ipmt_nominal - old_suffix_ipmt + new_suffix_ipmt
+
+    prefix = {name: values[:month].copy() for name, values in arrays.items()}
+    prefix["ppmt"][-1] += prepayment
+    prefix["pmt"][-1] += prepayment
+    prefix["balance"][-1] -= prepayment
+    if "cumulative" in prefix:
+        prefix["cumulative"][-1] += prepayment
+    if new_balance == 0:
+        return prefix, total_ipmt_nominal
+
+    suffix["months"] = np.arange(month + 1, months + 1)
+    suffix["pmt"] = suffix["ppmt"] + suffix["ipmt"]
+    if "cumulative" in prefix:
+        suffix["cumulative"] = prefix["cumulative"][-1] + np.cumsum(suffix["pmt"])
+    return {
+        name: np.concatenate((values, suffix[name]))
+        for name, values in prefix.items()}, total_ipmt_nominal
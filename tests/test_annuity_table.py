@@ -0,0 +1,29 @@
+"""The memory-mapped annuity table only ever maps the table it builds."""
+import numpy as np
+import pytest
+
+from scripts import annuity_table
+
+
+@pytest.fixture
+def table_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "annuity.npy")
+    monkeypatch.setattr(annuity_table, "table_path", path)
+    monkeypatch.setattr(annuity_table, "table", None)
+    return path
+
+
+@pytest.mark.parametrize("plant", [
+    lambda path: None,
+    lambda path: np.save(path, np.zeros((1001, 420))),
+    lambda path: np.save(path, annuity_table.build_table()[:, :100]),
+    lambda path: np.save(path, annuity_table.build_table().astype(np.float32)),
+    lambda path: open(path, "wb").write(b"not a table"),
+], ids=["missing", "planted", "shape", "dtype", "junk"])
+def test_bad_files_are_replaced(table_path, plant):
+    plant(table_path)
+    table = annuity_table.get_table()
+    assert isinstance(table, np.memmap)
+    np.testing.assert_array_equal(table, annuity_table.build_table())
+    np.testing.assert_array_equal(
+        np.load(table_path), annuity_table.build_table())
@@ -0,0 +1,30 @@
+"""Yearly bars of the payments figure around a zoomed-in range."""
+import numpy as np
+
+from scripts.figures import yearly_bars
+
+
+def test_zoom_inside_one_year():
+    months = np.arange(1, 361)
+    values = np.sqrt(months)
+    x, widths, (bars,) = yearly_bars(months, [values], 150, (15, 20))
+
+    detail = (x >= 15) & (x <= 20) & (widths == 1)
+    np.testing.assert_array_equal(x[detail], np.arange(15, 21))
+    # Every other bar covers whole months on one side of the zoom.
+    left = x[~detail] - widths[~detail] / 2
+    right = x[~detail] + widths[~detail] / 2
+    assert np.all((right <= 14.5) | (left >= 20.5))
+    # The year around the zoom is split in two, not averaged over it.
+    assert [13, 21] == [
+        int(start + 0.5) for start in left if 13 <= start + 0.5 <= 24]
+    assert widths.sum() == len(months)
+    np.testing.assert_allclose((bars * widths).sum(), values.sum())
+
+
+def test_no_zoom():
+    months = np.arange(1, 241)
+    x, widths, (bars,) = yearly_bars(months, [months * 1.0], 150, None)
+    np.testing.assert_array_equal(widths, 12)
+    np.testing.assert_allclose(x, np.arange(20) * 12 + 6.5)
+    np.testing.assert_allclose(bars, x)
@@ -0,0 +1,52 @@
+"""Mixes summed by aggregate_mix against the sum of their tracks' own
+schedules, with two mixes' edits interleaved as concurrent sessions do."""
+import numpy as np
+
+from scripts.mix_aggregator import aggregate_mix
+from scripts.schedule_engine import get_schedule_arrays
+
+first = [
+    ("straight", [1], 1.48953, 100000, 3, 240),
+    ("declining", [], 0, 250000, 4.5, 360),
+    None,
+]
+second = [
+    ("bullet", [1], 1.48953, 200000, 3.5, 120),
+    ("straight", [], 0, 150000, 2, 300),
+]
+
+
+def expected_mix(tracks):
+    tracks = [params for params in tracks if params is not None]
+    length = max(params[-1] for params in tracks)
+    totals = {}
+    for params in tracks:
+        arrays, _ = get_schedule_arrays(*params)
+        for name, values in arrays.items():
+            if name != "months":
+                totals.setdefault(name, np.zeros(length))
+                totals[name][:len(values)] += values
+    return totals, sum(params[3] for params in tracks)
+
+
+def edited(tracks, slot, amount):
+    tracks = list(tracks)
+    tracks[slot] = tracks[slot][:3] + (amount,) + tracks[slot][4:]
+    return tracks
+
+
+def test_interleaved_mixes_are_exact():
+    mixes = [first, second]
+    for step in range(20):
+        which = step % 2
+        mixes[which] = edited(mixes[which], 0, 100000 + step * 1000)
+        arrays, _, amount = aggregate_mix(mixes[which])
+        totals, expected_amount = expected_mix(mixes[which])
+        assert amount == expected_amount
+        assert sorted(arrays) == sorted([*totals, "months"])
+        for name, values in totals.items():
+            np.testing.assert_array_equal(arrays[name], values, err_msg=name)
+
+
+def test_no_tracks():
+    assert aggregate_mix([None, None]) is None
@@ -0,0 +1,91 @@
+"""The mix search: its share grid, its bounds, and its ranking against a
+brute-force pricing of every candidate mix."""
+import itertools
+
+import numpy as np
+import pytest
+
+from scripts.optimizer import check_search, optimize_mix, share_grid
+from scripts.schedule_engine import get_schedule_arrays
+
+offers = [
+    {"schedule": "straight", "linked": False, "interest": 3,
+     "periods": [120, 240, 360]},
+    {"schedule": "declining", "linked": True, "madad": 1.5, "interest": 2,
+     "periods": [120, 180, 300]},
+]
+
+
+def test_share_grid():
+    shares = share_grid([{}, {}, {}], 0.5)
+    assert len(shares) == 6  # 2 halves among 3 offers
+    np.testing.assert_allclose(shares.sum(axis=1), 1)
+    assert len({tuple(row) for row in shares}) == len(shares)
+    assert set(shares.ravel()) == {0, 0.5, 1}
+
+
+def test_share_grid_max_share():
+    shares = share_grid([{"max_share": 0.3}, {}], 0.1)
+    assert shares[:, 0].max() == pytest.approx(0.3)
+    assert len(shares) == 4
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"offers": [{}] * 7}, "1 to 6 offers"),
+    ({"offers": []}, "1 to 6 offers"),
+    ({"offers": {}}, "1 to 6 offers"),
+    ({"offers": [{}], "step": 0.01}, "step"),
+    ({"offers": [{"periods": [60, 120, 180, 240, 300, 360]}]}, "periods"),
+    ({"offers": [{"periods": [500]}]}, "1 to 420 months"),
+    ({"offers": [{"periods": [120.0]}]}, "1 to 420 months"),
+])
+def test_check_search(params, message):
+    with pytest.raises(ValueError, match=message):
+        check_search(1000000, **params)
+
+
+def brute_force(total, offers, step, max_first_pmt):
+    # Total payment of every distinct feasible mix, priced track by track.
+    costs = {}
+    for shares in share_grid(offers, step):
+        for periods in itertools.product(
+                *(offer["periods"] for offer in offers)):
+            mix = tuple(
+                (share, period if share else None)
+                for share, period in zip(shares, periods))
+            pmt = np.zeros(max(periods))
+            for offer, share, period in zip(offers, shares, periods):
+                if share:
+                    arrays, _ = get_schedule_arrays(
+                        offer["schedule"], [1] * offer["linked"],
+                        offer.get("madad", 0), share * total,
+                        offer["interest"], period)
+                    pmt[:period] += arrays["pmt"]
+            if pmt[0] <= max_first_pmt:
+                costs[mix] = pmt.sum()
+    return sorted(costs.values())
+
+
+def test_ranking():
+    mixes = optimize_mix(
+        1000000, offers, step=0.25, max_first_pmt=7000, top=5, workers=1)
+    expected = brute_force(1000000, offers, 0.25, 7000)[:5]
+    np.testing.assert_allclose(
+        [mix["total_pmt"] for mix in mixes], expected, rtol=1e-9)
+    for mix in mixes:
+        assert mix["first_pmt"] <= 7000
+        assert sum(track["amount"] for track in mix["tracks"]) == (
+            pytest.approx(1000000))
+
+
+def test_workers_agree():
+    kwargs = {"step": 0.1, "max_first_pmt": 8000, "top": 10}
+    serial = optimize_mix(1000000, offers, workers=1, **kwargs)
+    parallel = optimize_mix(1000000, offers, workers=2, **kwargs)
+    assert len(serial) == len(parallel) == 10
+    for one, other in zip(serial, parallel):
+        assert one["total_pmt"] == pytest.approx(other["total_pmt"])
+        assert [(track["offer"], track["period"], track["amount"])
+                for track in one["tracks"]] == [
+            (track["offer"], track["period"], track["amount"])
+            for track in other["tracks"]]
@@ -0,0 +1,120 @@
+"""The schedule engine against the outputs of the per-schedule generators it
+replaced (generate_pd_per_maslul_straight/declining/bullet), sampled at the
+first, second, middle and last months, including one-month and zero-rate
+loans."""
+import numpy as np
+import pytest
+
+from scripts import annuity_table, schedule_engine
+from scripts.schedule_engine import get_batch_arrays, get_schedule_arrays
+
+old_schedules = [
+    (('straight', [1], 1.48953, 100000, 3, 240), 33103.42348493883, [0, 1, 120, 239], {
+        'ppmt': [304.9756872371968, 306.11763154820545, 477.5736141969314, 745.0618111201587],
+        'ipmt': [250.31031875, 249.857637076073, 166.8420361644404, 1.8626545278003976],
+        'pmt': [555.2860059871967, 555.9752686242784, 644.4156503613717, 746.9244656479591],
+        'cumulative': [555.2860059871967, 1111.261274611475, 72449.32944801297, 155135.32321755475],
+        'balance': [99943.05483042917, 99760.6140381025, 66341.48679076608, -2.99321988761676e-09],
+    }),
+    (('straight', [], 1.48953, 250000, 4.5, 360), 206016.77884329195, [0, 1, 180, 359], {
+        'ppmt': [329.2132745647143, 330.44782434433205, 645.769947468943, 1261.980846390749],
+        'ipmt': [937.5, 936.2654502203823, 620.9433270957713, 4.732428173965163],
+        'pmt': [1266.7132745647143, 1266.7132745647143, 1266.7132745647143, 1266.7132745647143],
+        'cumulative': [1266.7132745647143, 2533.4265491294286, 229275.10269621288, 456016.77884329605],
+        'balance': [249670.7867254353, 249340.33890109096, 164939.11727806838, -5.06656760990154e-09],
+    }),
+    (('straight', [1], 1.48953, 100000, 3, 1), 250.0, [0], {
+        'ppmt': [100124.12750000214],
+        'ipmt': [250.31031875],
+        'pmt': [100374.43781875214],
+        'cumulative': [100374.43781875214],
+        'balance': [-2.1563567672274073e-09],
+    }),
+    (('straight', [1], 1.48953, 100000, 0, 120), 0.0, [0, 1, 60, 119], {
+        'ppmt': [834.3677291666667, 835.4034089696879, 898.8395502614102, 967.0926984970548],
+        'ipmt': [0.0, 0.0, 0.0, 0.0],
+        'pmt': [834.3677291666667, 835.4034089696879, 898.8395502614102, 967.0926984970548],
+        'cumulative': [834.3677291666667, 1669.7711381363547, 52838.837612533775, 107893.41388469309],
+        'balance': [99413.00566739285, 98699.96417166648, 53097.36018212547, -3.164417130960828e-11],
+    }),
+    (('declining', [1], 1.48953, 300000, 2.5, 300), 106991.77449629686, [0, 1, 150, 299], {
+        'ppmt': [1001.241275, 1002.4840907636254, 1206.0086774602737, 1450.852879871211],
+        'ipmt': [625.775796875, 624.4640482048418, 376.8777117063348, 3.0226101663972127],
+        'pmt': [1627.017071875, 1626.9481389684672, 1582.8863891666085, 1453.8754900376082],
+        'cumulative': [1627.017071875, 3253.9652108434675, 243248.74747508392, 470660.96565616375],
+        'balance': [299742.74313832406, 299111.0778626097, 179918.34421632648, -5.495613636071539e-10],
+    }),
+    (('declining', [], 0, 100000, 0, 60), 0.0, [0, 1, 30, 59], {
+        'ppmt': [1666.6666666666667, 1666.6666666666667, 1666.6666666666667, 1666.6666666666667],
+        'ipmt': [0.0, 0.0, 0.0, 0.0],
+        'pmt': [1666.6666666666667, 1666.6666666666667, 1666.6666666666667, 1666.6666666666667],
+        'cumulative': [1666.6666666666667, 3333.3333333333335, 51666.66666666665, 100000.00000000006],
+        'balance': [98333.33333333333, 96666.66666666666, 48333.33333333326, -5.866240826435387e-11],
+    }),
+    (('declining', [1], 1.48953, 100000, 3, 1), 250.0, [0], {
+        'ppmt': [100124.12749999999],
+        'ipmt': [250.31031874999996],
+        'pmt': [100374.43781874998],
+        'cumulative': [100374.43781874998],
+        'balance': [0.0],
+    }),
+    (('bullet', [1], 1.48953, 200000, 3.5, 120), 70000.0, [0, 1, 60, 119], {
+        'ppmt': [0.0, 0.0, 0.0, 232102.24763929314],
+        'ipmt': [584.0574104166667, 584.7823862787816, 629.1876851829871, 676.9648889479383],
+        'pmt': [584.0574104166667, 584.7823862787816, 629.1876851829871, 232779.21252824107],
+        'balance': [200248.25499999998, 200496.81815272509, 215721.49206273843, 0.0],
+    }),
+    (('bullet', [], 1.48953, 100000, 0, 1), 0.0, [0], {
+        'ppmt': [100000.0],
+        'ipmt': [0.0],
+        'pmt': [100000.0],
+        'balance': [0.0],
+    }),
+]
+
+
+@pytest.mark.parametrize("case, total, rows, columns", old_schedules)
+def test_matches_old_generators(case, total, rows, columns):
+    arrays, total_ipmt_nominal = get_schedule_arrays(*case)
+    assert isinstance(total_ipmt_nominal, float)
+    assert total_ipmt_nominal == pytest.approx(total, rel=1e-12, abs=1e-9)
+    assert len(arrays["pmt"]) == case[-1]
+    for name, expected in columns.items():
+        np.testing.assert_allclose(
+            arrays[name][rows], expected, rtol=1e-9, atol=1e-6, err_msg=name)
+
+
+def test_empty_batch():
+    arrays, total_ipmt_nominal = get_batch_arrays([], [], [], [], [], [])
+    assert arrays["pmt"].shape == (0, 0)
+    assert total_ipmt_nominal.shape == (0,)
+
+
+def test_prime_is_straight_at_prime_plus_spread():
+    prime, prime_total = get_schedule_arrays(
+        "prime", [1], 1.5, 100000, -0.5, 240)
+    rate = schedule_engine.prime_path[0] - 0.5
+    straight, straight_total = get_schedule_arrays(
+        "straight", [1], 1.5, 100000, rate, 240)
+    for name, values in straight.items():
+        np.testing.assert_allclose(prime[name], values, rtol=1e-9, atol=1e-6)
+    assert prime_total == pytest.approx(straight_total)
+
+
+def test_prime_follows_its_path(monkeypatch):
+    # The path moves after a year and stays flat after its last month.
+    monkeypatch.setattr(schedule_engine, "prime_path", (5.0,) * 12 + (6.0,))
+    prime, _ = get_schedule_arrays("prime", [], 0, 100000, 0.5, 120)
+    curve = [5.5] * 12 + [6.5] * 108
+    straight, _ = get_schedule_arrays("straight", [], 0, 100000, curve, 120)
+    for name, values in straight.items():
+        np.testing.assert_allclose(prime[name], values, rtol=1e-9, atol=1e-6)
+    assert prime["pmt"][12] > prime["pmt"][11]
+
+
+def test_prime_quote_matches_schedule():
+    track = ("prime", [1], 1.5, 100000, -0.5, 240)
+    quote = annuity_table.quote(*track)
+    arrays, _ = get_schedule_arrays(*track)
+    assert quote["first_pmt"] == pytest.approx(arrays["pmt"][0])
+    assert quote["total_pmt"] == pytest.approx(arrays["pmt"].sum())
@@ -0,0 +1,59 @@
+"""What-if changes against the same track priced from scratch."""
+import numpy as np
+import pytest
+
+from scripts.schedule_engine import get_schedule_arrays
+from scripts.what_if import what_if
+
+tracks = [
+    ("straight", [1], 1.5, 100000, 3, 240),
+    ("declining", [], 0, 250000, 4, 180),
+    ("bullet", [1], 1.5, 200000, 3.5, 120),
+    ("variable", [1], 1.5, 100000, [3] * 60 + [4] * 180, 240),
+    ("prime", [1], 1.5, 100000, -0.5, 240),
+]
+
+
+def assert_same(arrays, expected):
+    assert sorted(arrays) == sorted(expected)
+    for name, values in expected.items():
+        np.testing.assert_allclose(
+            arrays[name], values, rtol=1e-9, atol=1e-6, err_msg=name)
+
+
+@pytest.mark.parametrize("track", tracks, ids=lambda track: track[0])
+@pytest.mark.parametrize("month", [1, 60, 119])
+def test_no_change(track, month):
+    arrays, total_ipmt_nominal = what_if(*track, month)
+    expected, expected_total = get_schedule_arrays(*track)
+    assert_same(arrays, expected)
+    assert total_ipmt_nominal == pytest.approx(expected_total)
+
+
+@pytest.mark.parametrize("schedule", ["straight", "declining", "bullet"])
+def test_rate_change_is_a_curve(schedule):
+    track = (schedule, [1], 1.5, 100000, 3, 120)
+    arrays, total_ipmt_nominal = what_if(*track, 48, new_interest=5)
+    expected, expected_total = get_schedule_arrays(
+        *track[:4], [3] * 48 + [5] * 72, 120)
+    assert_same(arrays, expected)
+    assert total_ipmt_nominal == pytest.approx(expected_total)
+
+
+@pytest.mark.parametrize("track", tracks, ids=lambda track: track[0])
+def test_prepayment_lowers_the_balance(track):
+    month = 60
+    before, _ = get_schedule_arrays(*track)
+    after, _ = what_if(*track, month, prepayment=30000)
+    assert after["balance"][month - 1] == pytest.approx(
+        before["balance"][month - 1] - 30000)
+    assert np.all(after["balance"][month:-1] < before["balance"][month:-1])
+    assert after["balance"][-1] == pytest.approx(0, abs=1e-6)
+    assert after["pmt"][month - 1] == pytest.approx(
+        before["pmt"][month - 1] + 30000)
+
+
+@pytest.mark.parametrize("month", [0, 240, -1, 500])
+def test_month_out_of_range(month):
+    with pytest.raises(ValueError, match="month must be between 1 and 239"):
+        what_if(*tracks[0], month)